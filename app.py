@@ -1,10 +1,28 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, abort, make_response, session, g
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask_sqlalchemy.record_queries import get_recorded_queries
+# to_tsvector / to_tsquery などの Postgres の全文検索関数を func に登録する
+import sqlalchemy.dialects.postgresql
 import os
-from datetime import datetime
-import json
+import hmac
+import hashlib
+import glob
+import uuid
+import tempfile
+import threading
+from datetime import date, datetime, time, timedelta, timezone
+import unicodedata
+from functools import wraps
+from collections import namedtuple
 from flask_login import LoginManager, UserMixin, login_user, logout_user, current_user, login_required
+from autocomplete import PrefixIndex
+from cache import LRUCache, make_cache
+from markupsafe import Markup
+from pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_page
+from passwords import HashSlots, PasswordHasher, PasswordHasherBusy
+from ratelimit import MemoryBucketStore, RateLimiter, SQLiteBucketStore
+from search import index_tokens, query_tokens, snippet
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('FLASK_SECRET_KEY', 'a-secure-default-key-for-development')
@@ -14,38 +32,147 @@ if app.config['SQLALCHEMY_DATABASE_URI'] and app.config['SQLALCHEMY_DATABASE_URI
     app.config['SQLALCHEMY_DATABASE_URI'] = app.config['SQLALCHEMY_DATABASE_URI'].replace("postgres://", "postgresql://", 1)
     
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# 1 を指定するとリクエストごとに発行されたクエリを記録し、query_budget の上限チェックを有効にする
+app.config['SQLALCHEMY_RECORD_QUERIES'] = os.environ.get('SQLALCHEMY_RECORD_QUERIES') == '1'
+# ログイン中のユーザー情報をプロセス内にキャッシュする秒数 (0 でキャッシュしない)
+app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 300))
+# パスワードハッシュの方式とパラメータ。変更すると、既存ユーザーは次回ログイン時に新しい設定でハッシュし直される
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+app.config['PASSWORD_SALT_LENGTH'] = int(os.environ.get('PASSWORD_SALT_LENGTH', 16))
+# ハッシュ計算に使うプロセス数 (gunicorn のワーカーごと)。0 ならリクエストを処理するプロセスで計算する。
+# 結果はリクエストを処理するワーカーが待つので、プロセスを分けて意味があるのはスレッドや gevent のワーカーだけ
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 0))
+# 同じホストで同時に計算するハッシュの数の上限 (0 で無制限)。枠が空かなければログイン・登録は 503 を返す
+app.config['PASSWORD_HASH_CONCURRENCY'] = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', os.cpu_count() or 1))
+app.config['PASSWORD_HASH_SLOT_DIR'] = os.environ.get('PASSWORD_HASH_SLOT_DIR', os.path.join(tempfile.gettempdir(), 'syukatsu-password-hash'))
+# ログイン・登録の試行回数の上限 ("回数/秒数")。"memory" 以外のストレージは同じホストのワーカー間で共有する SQLite ファイル
+app.config['RATELIMIT_STORAGE'] = os.environ.get('RATELIMIT_STORAGE', os.path.join(tempfile.gettempdir(), 'syukatsu-ratelimit.sqlite3'))
+app.config['RATELIMIT_LOGIN_IP'] = os.environ.get('RATELIMIT_LOGIN_IP', '10/60')
+app.config['RATELIMIT_LOGIN_USER'] = os.environ.get('RATELIMIT_LOGIN_USER', '5/300')
+app.config['RATELIMIT_REGISTER_IP'] = os.environ.get('RATELIMIT_REGISTER_IP', '5/3600')
+# リバースプロキシ (Render など) の段数。X-Forwarded-For から接続元 IP を取るために指定する
+app.config['TRUSTED_PROXY_COUNT'] = int(os.environ.get('TRUSTED_PROXY_COUNT', 0))
+# /metrics を見るためのトークン (未設定なら /metrics は 404)
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+# 企業詳細ページの一覧などを描画済みの HTML でキャッシュする先 (memory:// / file:///path / redis://host:port/db)
+app.config['CACHE_URL'] = os.environ.get('CACHE_URL', 'memory://?maxsize=2048')
+app.config['FRAGMENT_CACHE_TTL'] = int(os.environ.get('FRAGMENT_CACHE_TTL', 86400))
+# ダッシュボードの企業一覧と、タスク・書類・面接・メモの一覧の 1 ページの件数
+app.config['DASHBOARD_PAGE_SIZE'] = int(os.environ.get('DASHBOARD_PAGE_SIZE', 50))
+app.config['LIST_PAGE_SIZE'] = int(os.environ.get('LIST_PAGE_SIZE', 50))
+# 企業名・業界の入力補完のインデックスをプロセス内に持つ秒数 (他のワーカーでの変更はこの間隔で反映される)
+app.config['AUTOCOMPLETE_TTL'] = int(os.environ.get('AUTOCOMPLETE_TTL', 300))
+def source_digest():
+    # アプリのコード・テンプレート・静的ファイルの内容のハッシュ。gunicorn のワーカー間でも再起動をまたいでも同じ値になり、
+    # それらを変更したデプロイでだけ変わる
+    digest = hashlib.sha1()
+    for path in sorted(glob.glob(os.path.join(app.root_path, '*.py')) + glob.glob(os.path.join(app.root_path, 'templates', '**', '*'), recursive=True)
+                       + glob.glob(os.path.join(app.root_path, 'static', '**', '*'), recursive=True)):
+        if os.path.isfile(path):
+            digest.update(os.path.relpath(path, app.root_path).encode())
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+# コード・テンプレートのバージョン。描画済み HTML のキャッシュキーに含め、テンプレートを変えたら古い HTML を使わないようにする
+SOURCE_VERSION = source_digest()[:16]
+# ETag に混ぜる値。コードやテンプレートの変更後に古いページが返らないよう、デプロイごとに変わる値にする。
+# 未設定なら Render のコミットの SHA、それもなければ SOURCE_VERSION を使う (ワーカーごとに違う値にしないこと)
+app.config['ETAG_SALT'] = os.environ.get('ETAG_SALT') or os.environ.get('RENDER_GIT_COMMIT') or SOURCE_VERSION
+
+if app.config['TRUSTED_PROXY_COUNT']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXY_COUNT'])
 
 db = SQLAlchemy(app)
 
+def query_budget(limit):
+    # GET のビュー (テンプレート描画を含む) が発行するクエリ数の上限。N+1 の再発を検出するためのもの
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not app.config['SQLALCHEMY_RECORD_QUERIES'] or request.method != 'GET':
+                return view(*args, **kwargs)
+            before = len(get_recorded_queries())
+            response = view(*args, **kwargs)
+            issued = len(get_recorded_queries()) - before
+            assert issued <= limit, f'{request.endpoint} issued {issued} queries (budget: {limit})'
+            return response
+        return wrapper
+    return decorator
+
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
+password_hasher = PasswordHasher(
+    app.config['PASSWORD_HASH_METHOD'],
+    salt_length=app.config['PASSWORD_SALT_LENGTH'],
+    workers=app.config['PASSWORD_HASH_WORKERS'],
+    slots=HashSlots(app.config['PASSWORD_HASH_SLOT_DIR'], app.config['PASSWORD_HASH_CONCURRENCY'])
+    if app.config['PASSWORD_HASH_CONCURRENCY'] else None
+)
+
+if app.config['RATELIMIT_STORAGE'] == 'memory':
+    ratelimit_store = MemoryBucketStore()
+else:
+    ratelimit_store = SQLiteBucketStore(app.config['RATELIMIT_STORAGE'])
+login_ip_limiter = RateLimiter(ratelimit_store, 'login_ip', app.config['RATELIMIT_LOGIN_IP'])
+login_user_limiter = RateLimiter(ratelimit_store, 'login_user', app.config['RATELIMIT_LOGIN_USER'])
+register_ip_limiter = RateLimiter(ratelimit_store, 'register_ip', app.config['RATELIMIT_REGISTER_IP'])
+
+def now_in_app_tz():
+    # 作成・更新日時の既定値 (APP_TZ は「日付・日時の扱い」で定義)
+    return datetime.now(APP_TZ)
+
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     password_hash = db.Column(db.String(256), nullable=False)
+    # 企業・面接・タスク・書類・メモのいずれかが変更されるたびに 1 増える (ETag に使う)
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     companies = db.relationship('Company', backref='user', lazy=True, cascade="all, delete-orphan")
 
     def __repr__(self):
         return f'<User {self.username}>'
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self.password_hash)
 
 class Company(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
+    # 企業名の読み (ふりがな)。入力補完で読みからも企業名を探せるようにする
+    name_kana = db.Column(db.String(100))
     industry = db.Column(db.String(100))
     url = db.Column(db.String(200))
-    notes = db.Column(db.Text)
-    application_date = db.Column(db.String(20))
+    # 長くなりうるテキストは一覧では読み込まず、アクセスされたときに読み込む
+    notes = db.deferred(db.Column(db.Text))
+    application_date = db.Column(db.Date)
     selection_stage = db.Column(db.String(50))
     result = db.Column(db.String(50))
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # 作成・更新日時。差分同期 (/sync) で、前回の同期以降に変わった行を (user_id, updated_at) のインデックスで探す
+    created_at = db.Column(db.DateTime(timezone=True), default=now_in_app_tz)
+    updated_at = db.Column(db.DateTime(timezone=True), default=now_in_app_tz)
+    # 企業詳細ページの各一覧のバージョン。一覧の行が変わるたびに 1 増え、描画済み HTML のキャッシュキーに使う
+    interviews_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    tasks_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    documents_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    memos_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # 描画済み HTML のキャッシュキーに含める、企業ごとのランダムな値。一覧のバージョンは新しい企業では 0 から始まるので、
+    # 削除した企業の id が再利用されたり DB を作り直したりしても、以前の企業のキャッシュと同じキーにならないようにする
+    cache_token = db.Column(db.String(32), default=lambda: uuid.uuid4().hex)
+    __table_args__ = (
+        db.Index('ix_company_user_name', 'user_id', 'name'),
+        db.Index('ix_company_user_application_date', 'user_id', 'application_date'),
+        db.Index('ix_company_user_updated_at', 'user_id', 'updated_at'),
+    )
     def __repr__(self):
         return f'<Company {self.name}>'
 
@@ -53,23 +180,41 @@ class Interview(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     company_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False) 
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    date_time = db.Column(db.String(50)) 
+    date_time = db.Column(db.DateTime(timezone=True))
     location = db.Column(db.String(100))
     person = db.Column(db.String(100))
     url = db.Column(db.String(200))
-    notes = db.Column(db.Text)
+    notes = db.deferred(db.Column(db.Text))
+    created_at = db.Column(db.DateTime(timezone=True), default=now_in_app_tz)
+    updated_at = db.Column(db.DateTime(timezone=True), default=now_in_app_tz)
     company = db.relationship('Company', backref=db.backref('interviews', lazy=True, cascade="all, delete-orphan"))
+    __table_args__ = (
+        db.Index('ix_interview_user_date_time', 'user_id', 'date_time'),
+        db.Index('ix_interview_company_date_time', 'company_id', 'date_time'),
+        db.Index('ix_interview_user_updated_at', 'user_id', 'updated_at'),
+    )
     def __repr__(self):
-        return f'<Interview {self.company.name} - {self.date_time}>'
+        # repr のために企業を遅延ロードしない (未ロードなら company_id を表示する)
+        company = db.inspect(self).attrs.company.loaded_value
+        label = company.name if isinstance(company, Company) else self.company_id
+        return f'<Interview {label} - {self.date_time}>'
 
 class Task(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     company_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=True)
-    content = db.Column(db.Text, nullable=False)
-    deadline = db.Column(db.String(20))
+    content = db.deferred(db.Column(db.Text, nullable=False))
+    deadline = db.Column(db.Date)
     status = db.Column(db.String(20), default='未完了')
+    created_at = db.Column(db.DateTime(timezone=True), default=now_in_app_tz)
+    updated_at = db.Column(db.DateTime(timezone=True), default=now_in_app_tz)
     company = db.relationship('Company', backref=db.backref('tasks', lazy=True, cascade="all, delete-orphan"))
+    __table_args__ = (
+        db.Index('ix_task_user_deadline', 'user_id', 'deadline'),
+        db.Index('ix_task_user_status_deadline', 'user_id', 'status', 'deadline'),
+        db.Index('ix_task_company_deadline', 'company_id', 'deadline'),
+        db.Index('ix_task_user_updated_at', 'user_id', 'updated_at'),
+    )
     def __repr__(self):
         return f'<Task {self.content}>'
 
@@ -78,10 +223,18 @@ class Document(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     company_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=True)
     document_name = db.Column(db.String(100), nullable=False)
-    submission_date = db.Column(db.String(20))
+    submission_date = db.Column(db.Date)
     status = db.Column(db.String(50))
     file_path = db.Column(db.String(200))
+    created_at = db.Column(db.DateTime(timezone=True), default=now_in_app_tz)
+    updated_at = db.Column(db.DateTime(timezone=True), default=now_in_app_tz)
     company = db.relationship('Company', backref=db.backref('documents', lazy=True, cascade="all, delete-orphan"))
+    __table_args__ = (
+        db.Index('ix_document_user_submission_date', 'user_id', 'submission_date'),
+        db.Index('ix_document_company_document_name', 'company_id', 'document_name'),
+        db.Index('ix_document_user_status_submission_date', 'user_id', 'status', 'submission_date'),
+        db.Index('ix_document_user_updated_at', 'user_id', 'updated_at'),
+    )
     def __repr__(self):
         return f'<Document {self.document_name} for {self.company_id}>'
 
@@ -90,14 +243,254 @@ class Memo(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     company_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=True)
     title = db.Column(db.String(100), nullable=False)
-    content = db.Column(db.Text, nullable=False)
+    content = db.deferred(db.Column(db.Text, nullable=False))
+    created_at = db.Column(db.DateTime(timezone=True), default=now_in_app_tz)
+    updated_at = db.Column(db.DateTime(timezone=True), default=now_in_app_tz)
     company = db.relationship('Company', backref=db.backref('memos', lazy=True, cascade="all, delete-orphan"))
+    __table_args__ = (
+        db.Index('ix_memo_user_title', 'user_id', 'title'),
+        db.Index('ix_memo_company_title', 'company_id', 'title'),
+        db.Index('ix_memo_user_updated_at', 'user_id', 'updated_at'),
+    )
     def __repr__(self):
         return f'<Memo {self.title}>'
 
+# ダッシュボード用の読み取りモデル。企業・面接・タスク・書類から作る派生データで、
+# 元のデータを変更したトランザクションの中で refresh_read_models が作り直す (外部キーは張らない)
+class DashboardCompany(db.Model):
+    __tablename__ = 'dashboard_company'
+    company_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    industry = db.Column(db.String(100))
+    selection_stage = db.Column(db.String(50))
+    result = db.Column(db.String(50))
+    application_date = db.Column(db.Date)
+    # 今日 (日本時間) 以降で最も早い面接
+    next_interview_at = db.Column(db.DateTime(timezone=True))
+    open_task_count = db.Column(db.Integer, nullable=False, default=0)
+    # 未完了タスクの最も早い期限
+    nearest_deadline = db.Column(db.Date)
+    __table_args__ = (
+        db.Index('ix_dashboard_company_user_name', 'user_id', 'name'),
+        db.Index('ix_dashboard_company_user_industry', 'user_id', 'industry', 'name'),
+        db.Index('ix_dashboard_company_user_selection_stage', 'user_id', 'selection_stage', 'name'),
+        db.Index('ix_dashboard_company_user_result', 'user_id', 'result', 'name'),
+        db.Index('ix_dashboard_company_user_application_date', 'user_id', 'application_date', 'name'),
+    )
+    def __repr__(self):
+        return f'<DashboardCompany {self.name}>'
+
+class CalendarEvent(db.Model):
+    __tablename__ = 'calendar_event'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    # 元の企業・面接・タスク・書類の id
+    source_id = db.Column(db.Integer, nullable=False)
+    title = db.Column(db.String(100))
+    # 予定の日 (日本時間)。日時のある予定 (面接) は starts_at も持つ
+    start_day = db.Column(db.Date, nullable=False)
+    starts_at = db.Column(db.DateTime(timezone=True))
+    company_id = db.Column(db.Integer)
+    __table_args__ = (
+        db.Index('ix_calendar_event_user_start_day', 'user_id', 'start_day'),
+        db.Index('ix_calendar_event_company_id', 'company_id'),
+    )
+    def __repr__(self):
+        return f'<CalendarEvent {self.kind} {self.title} {self.start_day}>'
+
+class SearchDocument(db.Model):
+    # 全文検索の索引。企業・面接・タスク・メモ 1 件につき 1 行で、grams は search.index_tokens で
+    # 分割したトークンを空白でつないだもの。元のデータを変更したトランザクションの中で作り直す
+    __tablename__ = 'search_document'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    source_id = db.Column(db.Integer, nullable=False)
+    company_id = db.Column(db.Integer)
+    title = db.Column(db.String(100))
+    body = db.deferred(db.Column(db.Text))
+    grams = db.deferred(db.Column(db.Text, nullable=False))
+    __table_args__ = (
+        db.Index('ix_search_document_kind_source_id', 'kind', 'source_id', unique=True),
+        db.Index('ix_search_document_user_id', 'user_id'),
+        db.Index(
+            'ix_search_document_grams', db.text("to_tsvector('simple'::regconfig, grams)"), postgresql_using='gin'
+        ).ddl_if(dialect='postgresql'),
+    )
+    def __repr__(self):
+        return f'<SearchDocument {self.kind} {self.source_id}>'
+
+# Postgres ではトークンをそのまま (辞書なしの 'simple' で) tsvector にし、GIN インデックスで検索する。
+# インデックス (ix_search_document_grams) と同じ式にすること
+SEARCH_VECTOR = db.func.to_tsvector(db.literal_column("'simple'::regconfig"), SearchDocument.grams)
+
+# SQLite では FTS5 の仮想テーブルを索引にする (search_document を外部コンテンツとし、トリガーで同期する)
+for statement in (
+    "CREATE VIRTUAL TABLE search_document_fts USING fts5("
+    "grams, content='search_document', content_rowid='id', tokenize='unicode61 remove_diacritics 0')",
+    "CREATE TRIGGER search_document_ai AFTER INSERT ON search_document BEGIN "
+    "INSERT INTO search_document_fts (rowid, grams) VALUES (new.id, new.grams); END",
+    "CREATE TRIGGER search_document_ad AFTER DELETE ON search_document BEGIN "
+    "INSERT INTO search_document_fts (search_document_fts, rowid, grams) VALUES ('delete', old.id, old.grams); END",
+    "CREATE TRIGGER search_document_au AFTER UPDATE ON search_document BEGIN "
+    "INSERT INTO search_document_fts (search_document_fts, rowid, grams) VALUES ('delete', old.id, old.grams); "
+    "INSERT INTO search_document_fts (rowid, grams) VALUES (new.id, new.grams); END",
+):
+    db.event.listen(SearchDocument.__table__, 'after_create', db.DDL(statement).execute_if(dialect='sqlite'))
+db.event.listen(SearchDocument.__table__, 'after_drop', db.DDL('DROP TABLE IF EXISTS search_document_fts').execute_if(dialect='sqlite'))
+
+# 企業の選考段階・結果の変更履歴。追記するだけで更新・削除はしない (企業を削除しても残すので外部キーは張らない)
+class StageTransition(db.Model):
+    __tablename__ = 'stage_transition'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    company_id = db.Column(db.Integer, nullable=False)
+    from_stage = db.Column(db.String(50))
+    to_stage = db.Column(db.String(50))
+    from_result = db.Column(db.String(50))
+    to_result = db.Column(db.String(50))
+    changed_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    # to_stage の段階に入った日時 (段階が変わらない結果だけの変更では、前の行の値を引き継ぐ)
+    stage_entered_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    __table_args__ = (
+        db.Index('ix_stage_transition_company_changed_at', 'company_id', 'changed_at'),
+        db.Index('ix_stage_transition_user_changed_at', 'user_id', 'changed_at'),
+    )
+    def __repr__(self):
+        return f'<StageTransition {self.company_id} {self.from_stage} -> {self.to_stage}>'
+
+# 段階ごとの滞在日数 (kind='stage') と、応募から内定までの日数 (kind='offer', stage='') のヒストグラム。
+# 遷移を記録するたびに該当する日数の件数を 1 増やすので、中央値を出すのに履歴を読み直さなくてよい
+class StageDuration(db.Model):
+    __tablename__ = 'stage_duration'
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    kind = db.Column(db.String(20), primary_key=True)
+    stage = db.Column(db.String(50), primary_key=True)
+    days = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    def __repr__(self):
+        return f'<StageDuration {self.kind} {self.stage} {self.days}: {self.count}>'
+
+# 削除された企業・面接・タスク・書類・メモの記録 (差分同期でクライアントに削除を伝えるためのもの)
+class DeletedRecord(db.Model):
+    __tablename__ = 'deleted_record'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    source_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    __table_args__ = (
+        db.Index('ix_deleted_record_user_deleted_at', 'user_id', 'deleted_at'),
+    )
+    def __repr__(self):
+        return f'<DeletedRecord {self.kind} {self.source_id}>'
+
+# --- 日付・日時の扱い ---
+# 日時はすべて日本時間で扱う (日本には夏時間がないため固定オフセットで十分)
+APP_TZ = timezone(timedelta(hours=9), 'JST')
+
+DATE_FORMATS = ('%Y-%m-%d', '%Y/%m/%d', '%Y.%m.%d', '%Y年%m月%d日')
+DATETIME_FORMATS = (
+    '%Y-%m-%dT%H:%M', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S',
+    '%Y/%m/%d %H:%M', '%Y/%m/%d %H:%M:%S', '%Y年%m月%d日 %H:%M', '%Y年%m月%d日 %H時%M分',
+)
+
+def _parse(value, formats):
+    for fmt in formats:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
+
+def parse_datetime(value):
+    # フォームや既存データの日時文字列を APP_TZ のタイムゾーン付き datetime に変換する。
+    # 日付だけの場合は 0:00 とみなす。解釈できなければ None を返す
+    if not value:
+        return None
+    value = unicodedata.normalize('NFKC', value).strip()
+    parsed = _parse(value, DATETIME_FORMATS) or _parse(value, DATE_FORMATS)
+    if parsed is None:
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return to_app_tz(parsed)
+
+def parse_date(value):
+    # 2025-06-20 / 2025/06/20 / 2025年6月20日 などを date に変換する。解釈できなければ None を返す
+    if not value:
+        return None
+    parsed = _parse(unicodedata.normalize('NFKC', value).strip(), DATE_FORMATS)
+    if parsed is not None:
+        return parsed.date()
+    parsed = parse_datetime(value)
+    return parsed.date() if parsed else None
+
+class InvalidFormValue(ValueError):
+    # フォームの入力を解釈できなかった (メッセージはそのまま利用者に表示する)
+    pass
+
+def form_date(name, label, parse=parse_date, example='2025-06-20'):
+    # フォームの日付の欄。空なら None、入力があるのに解釈できなければ InvalidFormValue
+    # (黙って None にすると、入力した期限などが消えたことに気づけない)
+    value = request.form.get(name, '').strip()
+    parsed = parse(value)
+    if value and parsed is None:
+        raise InvalidFormValue(f'{label}「{value}」を読み取れませんでした。{example} のように入力してください。')
+    return parsed
+
+def form_datetime(name, label):
+    return form_date(name, label, parse_datetime, '2025-06-20 14:00')
+
+def to_app_tz(value):
+    # SQLite はタイムゾーンを保持しないため、naive な値は APP_TZ の時刻として扱う
+    if value.tzinfo is None:
+        return value.replace(tzinfo=APP_TZ)
+    return value.astimezone(APP_TZ)
+
+@app.template_filter('datetime_local')
+def datetime_local_filter(value):
+    # <input type="datetime-local"> の value 用
+    return to_app_tz(value).strftime('%Y-%m-%dT%H:%M') if value else ''
+
+@app.template_filter('format_datetime')
+def format_datetime_filter(value):
+    return to_app_tz(value).strftime('%Y/%m/%d %H:%M') if value else ''
+
+# --- ログインユーザーのキャッシュ ---
+class SessionUser(UserMixin):
+    # user_loader が返す軽量なユーザー。リクエストごとに User テーブルを読まないためのもの
+    # (パスワードハッシュは持たないので、認証には User を使うこと)
+    def __init__(self, id, username):
+        self.id = id
+        self.username = username
+
+    def __repr__(self):
+        return f'<SessionUser {self.username}>'
+
+user_cache = LRUCache(maxsize=10000, ttl=app.config['USER_CACHE_TTL'])
+fragment_cache = make_cache(app.config['CACHE_URL'], ttl=app.config['FRAGMENT_CACHE_TTL'])
+
+@db.event.listens_for(User, 'after_update')
+@db.event.listens_for(User, 'after_delete')
+def invalidate_cached_user(mapper, connection, target):
+    # ユーザー名やパスワードが変わったら (このプロセスの) キャッシュを捨てる
+    user_cache.delete(target.id)
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    user = user_cache.get(user_id)
+    if user is None:
+        row = db.session.get(User, user_id)
+        if row is None:
+            return None
+        user = SessionUser(row.id, row.username)
+        user_cache.set(user_id, user)
+    return user
 
 @app.route('/')
 def index():
@@ -113,8 +506,17 @@ def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
+        # パスワードのハッシュ計算や DB の検索より前に、試行回数の上限を確認する
+        if not login_ip_limiter.hit(request.remote_addr) or not login_user_limiter.hit(username):
+            app.logger.warning('ログインの試行回数が上限を超えました: ip=%s username=%s', request.remote_addr, username)
+            flash('ログインの試行回数が多すぎます。しばらくしてから再度お試しください。', 'danger')
+            return render_template('login.html'), 429
         user = User.query.filter_by(username=username).first()
         if user and user.check_password(password):
+            if user.password_needs_rehash():
+                # 古い設定で作られたハッシュは、平文のパスワードが手元にあるこの機会に作り直す
+                user.set_password(password)
+                db.session.commit()
             login_user(user)
             flash('ログインに成功しました！', 'success')
             next_page = request.args.get('next')
@@ -123,6 +525,17 @@ def login():
             flash('無効なユーザー名またはパスワードです。', 'danger')
     return render_template('login.html')
 
+@app.errorhandler(PasswordHasherBusy)
+def password_hasher_busy(exc):
+    # パスワードのハッシュ計算が混み合っているときは、ワーカーを待たせずにすぐ断る
+    app.logger.warning('パスワードのハッシュ計算が混み合っています: %s', exc)
+    db.session.rollback()
+    flash('ただいま混み合っています。しばらくしてから再度お試しください。', 'danger')
+    template = 'register.html' if request.endpoint == 'register' else 'login.html'
+    response = make_response(render_template(template, username=request.form.get('username', '')), 503)
+    response.headers['Retry-After'] = '5'
+    return response
+
 @app.route('/logout')
 @login_required
 def logout():
@@ -140,6 +553,11 @@ def register():
         password = request.form['password']
         confirm_password = request.form['confirm_password']
 
+        if not register_ip_limiter.hit(request.remote_addr):
+            app.logger.warning('ユーザー登録の試行回数が上限を超えました: ip=%s', request.remote_addr)
+            flash('登録の試行回数が多すぎます。しばらくしてから再度お試しください。', 'danger')
+            return render_template('register.html', username=username), 429
+
         if password != confirm_password:
             flash('パスワードが一致しません。', 'danger')
             return render_template('register.html', username=username)
@@ -159,103 +577,658 @@ def register():
 
     return render_template('register.html')
 
+# --- ユーザーごとのデータバージョンと ETag ---
+USER_DATA_MODELS = (Company, Interview, Task, Document, Memo)
+
+def changed_objects(db_session):
+    # この flush で追加・変更・削除される Company / Interview / Task / Document / Memo。
+    # after_flush の時点では new / dirty / deleted は flush 前の状態のまま参照できる
+    objects = [obj for obj in list(db_session.new) + list(db_session.deleted) if isinstance(obj, USER_DATA_MODELS)]
+    objects.extend(
+        obj for obj in db_session.dirty
+        if isinstance(obj, USER_DATA_MODELS) and db_session.is_modified(obj)
+    )
+    return objects
+
+@db.event.listens_for(db.session, 'after_flush')
+def bump_data_version(db_session, flush_context):
+    # 変更と同じトランザクションで持ち主の data_version を増やす
+    user_ids = {obj.user_id for obj in changed_objects(db_session)} - {None}
+    if user_ids:
+        users = User.__table__
+        db_session.connection().execute(
+            users.update().where(users.c.id.in_(user_ids)).values(data_version=users.c.data_version + 1)
+        )
+
+def etag_by_data_version(view):
+    # GET の応答にデータバージョンから作った ETag を付け、If-None-Match が一致すれば
+    # ビュー (モデルのクエリとテンプレートの描画) を実行せずに 304 を返す
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != 'GET':
+            return view(*args, **kwargs)
+        version = db.session.execute(db.select(User.data_version).where(User.id == current_user.id)).scalar_one()
+        # ビューでもキャッシュキーに使えるようにしておく
+        g.data_version = version
+        # 「次の面接」のように日付で変わる表示があるので、今日の日付も含める
+        today = datetime.now(APP_TZ).date()
+        etag = hashlib.sha1(
+            f"{app.config['ETAG_SALT']}:{current_user.id}:{current_user.username}:{version}:{today}:{request.full_path}".encode()
+        ).hexdigest()
+        # 表示待ちのフラッシュメッセージがあるときは、キャッシュされたページではなく描画し直したページを返す
+        if '_flashes' not in session and request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return wrapper
+
+# --- 運用向けの情報 ---
+@app.route('/metrics')
+def metrics():
+    # 試行回数の制限で受け付けた・拒否した件数 (Authorization: Bearer <METRICS_TOKEN> が必要)
+    token = app.config['METRICS_TOKEN']
+    if not token or not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(404)
+    return jsonify({
+        'ratelimit': ratelimit_store.counters(),
+        'fragment_cache': fragment_cache.stats(),
+        'user_cache': user_cache.stats(),
+        'autocomplete': autocomplete_indexes.stats(),
+    })
+
+# --- ダッシュボードの読み取りモデル ---
+# ダッシュボードの企業一覧 (dashboard_company) とカレンダーの予定 (calendar_event) は、
+# 企業・面接・タスク・書類を変更したトランザクションの中で作り直しておき、表示時はインデックスで読むだけにする
+READ_MODEL_SOURCES = (Company, Interview, Task, Document)
+
+def today_start():
+    # 日本時間の今日の 0:00
+    return datetime.combine(datetime.now(APP_TZ).date(), time.min, tzinfo=APP_TZ)
+
+def _next_interview_at(company_id, since):
+    # company_id の企業の since 以降で最も早い面接 (相関サブクエリ)
+    return db.select(db.func.min(Interview.date_time)).where(
+        Interview.company_id == company_id, Interview.date_time >= since
+    ).scalar_subquery()
+
+def dashboard_company_rows(condition, since):
+    # condition に当てはまる企業の dashboard_company の行 (INSERT ... SELECT 用)
+    open_tasks = db.and_(Task.company_id == Company.id, Task.status == '未完了')
+    return db.select(
+        Company.id,
+        Company.user_id,
+        Company.name,
+        Company.industry,
+        Company.selection_stage,
+        Company.result,
+        Company.application_date,
+        _next_interview_at(Company.id, since),
+        db.select(db.func.count(Task.id)).where(open_tasks).scalar_subquery(),
+        db.select(db.func.min(Task.deadline)).where(open_tasks).scalar_subquery()
+    ).where(condition)
+
+def calendar_items(user_id, company_ids=None, without_company=False):
+    # 応募日・面接・未完了タスク・書類提出日を UNION ALL でまとめ、1 回のクエリで取得する。
+    # company_ids を指定するとその企業の予定 (without_company なら企業に紐付かないタスク・書類も) だけを返す。
+    # ORM オブジェクトではなく (kind, id, title, starts_on, starts_at, company_id) の軽量な行を返す。
+    # DATE と TIMESTAMP を同じ列にまとめると型が揃えられてしまうため、日付は starts_on、日時は starts_at に入れる
+    def belongs(model, company_column, column):
+        conditions = [model.user_id == user_id, column.isnot(None)]
+        if company_ids is not None:
+            scope = [company_column.in_(company_ids)]
+            if without_company and company_column is not Company.id:
+                scope.append(company_column.is_(None))
+            conditions.append(db.or_(*scope))
+        return conditions
+
+    no_date = db.cast(db.null(), db.Date)
+    no_datetime = db.cast(db.null(), db.DateTime(timezone=True))
+
+    applications = db.select(
+        db.literal('application').label('kind'),
+        Company.id.label('id'),
+        Company.name.label('title'),
+        Company.application_date.label('starts_on'),
+        no_datetime.label('starts_at'),
+        Company.id.label('company_id')
+    ).where(*belongs(Company, Company.id, Company.application_date))
+
+    interviews = db.select(
+        db.literal('interview'),
+        Interview.id,
+        Company.name,
+        no_date,
+        Interview.date_time,
+        Interview.company_id
+    ).join(Company, Interview.company_id == Company.id).where(
+        *belongs(Interview, Interview.company_id, Interview.date_time)
+    )
+
+    tasks = db.select(
+        db.literal('task'),
+        Task.id,
+        db.func.substr(Task.content, 1, 10),
+        Task.deadline,
+        no_datetime,
+        Task.company_id
+    ).where(Task.status == '未完了', *belongs(Task, Task.company_id, Task.deadline))
+
+    documents = db.select(
+        db.literal('document'),
+        Document.id,
+        Document.document_name,
+        Document.submission_date,
+        no_datetime,
+        Document.company_id
+    ).where(*belongs(Document, Document.company_id, Document.submission_date))
+
+    return db.union_all(applications, interviews, tasks, documents)
+
+def refresh_read_models(connection, user_id, company_ids=None, without_company=False):
+    # company_ids の企業 (None ならユーザーのすべての企業) の読み取りモデルを元のテーブルから作り直す。
+    # without_company なら企業に紐付かないタスク・書類の予定も作り直す
+    dashboard = DashboardCompany.__table__
+    events = CalendarEvent.__table__
+    if company_ids is None:
+        connection.execute(dashboard.delete().where(dashboard.c.user_id == user_id))
+        connection.execute(events.delete().where(events.c.user_id == user_id))
+        companies = Company.user_id == user_id
+    else:
+        company_ids = list(company_ids)
+        scope = [events.c.company_id.in_(company_ids)]
+        if without_company:
+            scope.append(events.c.company_id.is_(None))
+        if company_ids:
+            connection.execute(dashboard.delete().where(dashboard.c.company_id.in_(company_ids)))
+        connection.execute(events.delete().where(events.c.user_id == user_id, db.or_(*scope)))
+        companies = db.and_(Company.user_id == user_id, Company.id.in_(company_ids))
+
+    if company_ids is None or company_ids:
+        connection.execute(dashboard.insert().from_select(
+            ['company_id', 'user_id', 'name', 'industry', 'selection_stage', 'result', 'application_date',
+             'next_interview_at', 'open_task_count', 'nearest_deadline'],
+            dashboard_company_rows(companies, today_start())
+        ))
+
+    # 面接の日 (日本時間) はデータベースごとに書き方が違うので、Python で計算してまとめて挿入する
+    rows = [
+        {
+            'user_id': user_id,
+            'kind': item.kind,
+            'source_id': item.id,
+            'title': item.title,
+            'start_day': to_app_tz(item.starts_at).date() if item.starts_at else item.starts_on,
+            'starts_at': item.starts_at,
+            'company_id': item.company_id,
+        }
+        for item in connection.execute(calendar_items(user_id, company_ids, without_company))
+    ]
+    if rows:
+        connection.execute(events.insert(), rows)
+
+@db.event.listens_for(db.session, 'after_flush')
+def refresh_read_models_on_flush(db_session, flush_context):
+    # 変更された企業の行と予定だけを作り直す (キーが None の集合は企業に紐付かないタスク・書類)。
+    # bump_data_version の後に実行されるので、同じユーザーの書き込みは user 行のロックで直列化されている
+    targets = {}
+    for obj in changed_objects(db_session):
+        if not isinstance(obj, READ_MODEL_SOURCES):
+            continue
+        company_ids = targets.setdefault(obj.user_id, set())
+        if isinstance(obj, Company):
+            company_ids.add(obj.id)
+        else:
+            company_ids.add(obj.company_id)
+            company_ids.update(db.inspect(obj).attrs.company_id.history.deleted)
+    for user_id, company_ids in targets.items():
+        refresh_read_models(db_session.connection(), user_id, company_ids - {None}, None in company_ids)
+
+def rebuild_read_models(engine, user_ids=None):
+    # 読み取りモデルをユーザー (省略時は全ユーザー) ごとに作り直し、ユーザーごとにコミットする。
+    # 同じユーザーの書き込みと競合しないよう、作り直す間は user 行をロックする
+    if user_ids is None:
+        with engine.connect() as connection:
+            user_ids = connection.execute(db.select(User.id).order_by(User.id)).scalars().all()
+    for user_id in user_ids:
+        with engine.begin() as connection:
+            connection.execute(db.select(User.id).where(User.id == user_id).with_for_update())
+            refresh_read_models(connection, user_id)
+    return len(user_ids)
+
+def refresh_next_interviews(user_id, since):
+    # 次の面接の日時が過ぎた行だけを、since 以降の面接で更新する (日付が変わった後の最初の表示で 1 回だけ)
+    dashboard = DashboardCompany.__table__
+    db.session.execute(
+        dashboard.update()
+        .where(dashboard.c.user_id == user_id, dashboard.c.next_interview_at < since)
+        .values(next_interview_at=_next_interview_at(dashboard.c.company_id, since))
+    )
+
+# --- 一覧ページの共通処理 ---
+def list_page(query, keys, per_page=None, **kwargs):
+    # URL の cursor の続きから 1 ページ分を読む (pagination.keyset_page)。cursor が壊れていれば 400
+    try:
+        return keyset_page(db.session, query, keys, request.args.get('cursor'), per_page or app.config['LIST_PAGE_SIZE'], **kwargs)
+    except InvalidCursor:
+        abort(400)
+
+def company_choices():
+    # 追加フォームの「関連企業」の選択肢 (id, name)。読み取りモデルの (user_id, name) インデックスで読む
+    return db.session.execute(
+        db.select(DashboardCompany.company_id.label('id'), DashboardCompany.name)
+        .where(DashboardCompany.user_id == current_user.id).order_by(DashboardCompany.name)
+    ).all()
+
+def company_id_from_form(required=False):
+    # フォームで選ばれた企業の id。自分の企業でなければ 404、未選択なら None (required なら 400)
+    company_id = request.form.get('company_id', type=int)
+    if company_id is None:
+        if required:
+            abort(400)
+        return None
+    owned = db.session.execute(
+        db.select(Company.id).where(Company.id == company_id, Company.user_id == current_user.id)
+    ).scalar()
+    if owned is None:
+        abort(404)
+    return company_id
+
+# 期限・提出日での絞り込み: 今日からの日数の範囲 [開始, 終了) (None は制限なし)
+DUE_WINDOWS = {
+    'overdue': (None, 0),
+    'today': (0, 1),
+    'week': (0, 8),
+    'month': (0, 31),
+}
+
+def due_window_conditions(column, due):
+    if due not in DUE_WINDOWS:
+        return []
+    today = today_start().date()
+    start, end = DUE_WINDOWS[due]
+    conditions = [column < today + timedelta(days=end)]
+    if start is not None:
+        conditions.append(column >= today + timedelta(days=start))
+    return conditions
+
+def redirect_back(default):
+    # フォームの next (このサイト内のパスだけ) に戻る。なければ default へ
+    target = request.form.get('next', '')
+    if target.startswith('/') and not target.startswith(('//', '/\\')):
+        return redirect(target)
+    return redirect(default)
+
+# ダッシュボードの企業一覧で並べ替えに使える列 (インデックスは (user_id, 列, name))
+DASHBOARD_SORTS = {
+    'name': DashboardCompany.name,
+    'industry': DashboardCompany.industry,
+    'selection_stage': DashboardCompany.selection_stage,
+    'result': DashboardCompany.result,
+    'application_date': DashboardCompany.application_date,
+}
+
+# 絞り込みの項目 (ファセット): 列名 -> (表示名, 未設定のときの表示)。
+# 複数の値を選ぶと OR で絞り込む。URL では未設定 (NULL か空文字) を空文字で表す
+DASHBOARD_FACETS = {
+    'industry': ('業界', '未設定'),
+    'selection_stage': ('選考段階', '未設定'),
+    'result': ('結果', '選考中'),
+}
+
+def _facet_condition(column, values):
+    # (user_id, 列, name) のインデックスで引ける IN / IS NULL の条件にする
+    conditions = [column.in_(values)]
+    if '' in values:
+        conditions.append(column.is_(None))
+    return db.or_(*conditions)
+
+def _dashboard_filters():
+    # 企業一覧の絞り込み条件。企業名は部分一致、応募日は範囲、業界・選考段階・結果は選んだ値のいずれか。
+    # ファセットの条件は、件数を数えるときに自分の項目の分だけ外すので別に返す
+    filters = {name: request.args.get(name, '').strip() for name in ('q', 'applied_from', 'applied_to')}
+    conditions = []
+    if filters['q']:
+        conditions.append(DashboardCompany.name.contains(filters['q'], autoescape=True))
+    applied_from = parse_date(filters['applied_from'])
+    if applied_from:
+        conditions.append(DashboardCompany.application_date >= applied_from)
+    applied_to = parse_date(filters['applied_to'])
+    if applied_to:
+        conditions.append(DashboardCompany.application_date <= applied_to)
+    facet_conditions = {}
+    for name in DASHBOARD_FACETS:
+        values = sorted({value.strip() for value in request.args.getlist(name)})
+        if values:
+            filters[name] = values
+            facet_conditions[name] = _facet_condition(getattr(DashboardCompany, name), values)
+    return {name: value for name, value in filters.items() if value}, conditions, facet_conditions
+
+def dashboard_facets(conditions, facet_conditions, filters):
+    # 各ファセットの値ごとの件数を、項目ごとの GROUP BY を UNION ALL でつないだ 1 つのクエリで数える。
+    # ある項目の件数には、その項目以外の絞り込みだけを適用する (その値を選び足したときに増える件数になる)。
+    # 返り値は [(列名, 表示名, [(値, 表示, 件数, 選択中か), ...]), ...]
+    queries = []
+    for name in DASHBOARD_FACETS:
+        column = getattr(DashboardCompany, name)
+        others = [condition for other, condition in facet_conditions.items() if other != name]
+        queries.append(
+            db.select(db.literal(name).label('facet'), column.label('value'), db.func.count().label('count'))
+            .where(DashboardCompany.user_id == current_user.id, *conditions, *others)
+            .group_by(column)
+        )
+    counts = {name: {} for name in DASHBOARD_FACETS}
+    for facet, value, count in db.session.execute(db.union_all(*queries)):
+        counts[facet][value or ''] = counts[facet].get(value or '', 0) + count
+    facets = []
+    for name, (label, empty_label) in DASHBOARD_FACETS.items():
+        selected = set(filters.get(name, ()))
+        # 他の条件で 0 件になった値も、選択中なら外せるように残す
+        values = dict.fromkeys(selected, 0) | counts[name]
+        options = [
+            (value, value or empty_label, count, value in selected)
+            for value, count in sorted(values.items(), key=lambda item: (-item[1], item[0]))
+        ]
+        facets.append((name, label, options))
+    return facets
+
 @app.route('/dashboard', methods=['GET', 'POST'])
 @login_required 
+@etag_by_data_version
+@query_budget(4)
 def dashboard():
     if request.method == 'POST':
         name = request.form.get('name')
         if name:
-            new_company = Company(name=name, industry=request.form.get('industry'), url=request.form.get('url'), notes=request.form.get('notes'), user_id=current_user.id)
+            new_company = Company(name=name, name_kana=request.form.get('name_kana'), industry=request.form.get('industry'), url=request.form.get('url'), notes=request.form.get('notes'), user_id=current_user.id)
             db.session.add(new_company)
             db.session.commit()
             flash('企業が追加されました', 'success')
         return redirect(url_for('dashboard'))
-    
-    calendar_events = []
-    
-    companies = Company.query.filter_by(user_id=current_user.id).all()
-    for company in companies:
-        if company.application_date:
-            calendar_events.append({
-                'title': f"応募: {company.name}",
-                'start': company.application_date,
-                'url': url_for('company_detail', company_id=company.id),
-                'backgroundColor': '#28a745',
-                'borderColor': '#28a745',
-                'textColor': 'black'
-            })
-
-    interviews = Interview.query.filter_by(user_id=current_user.id).all()
-    for interview in interviews:
-        if interview.date_time:
-            calendar_events.append({
-                'title': f"面接: {interview.company.name}",
-                'start': interview.date_time,
-                'url': url_for('company_detail', company_id=interview.company_id),
-                'backgroundColor': '#dc3545',
-                'borderColor': '#dc3545',
-                'textColor': 'black'
-            })
-
-    tasks = Task.query.filter_by(user_id=current_user.id, status='未完了').all()
-    for task in tasks:
-        if task.deadline:
-            calendar_events.append({
-                'title': f"タスク〆: {task.content[:10]}",
-                'start': task.deadline,
-                'url': url_for('company_detail', company_id=task.company_id) if task.company_id else '#',
-                'backgroundColor': '#ffc107',
-                'borderColor': '#ffc107',
-                'textColor': 'black'
-            })
-            
-    documents = Document.query.filter_by(user_id=current_user.id).all()
-    for doc in documents:
-        if doc.submission_date:
-            calendar_events.append({
-                'title': f"書類提出: {doc.document_name}",
-                'start': doc.submission_date,
-                'url': url_for('company_detail', company_id=doc.company_id) if doc.company_id else '#',
-                'backgroundColor': '#17a2b8',
-                'borderColor': '#17a2b8',
-                'textColor': 'black'
-            })
 
+    filters, conditions, facet_conditions = _dashboard_filters()
+    sort = request.args.get('sort', 'name')
+    if sort not in DASHBOARD_SORTS:
+        sort = 'name'
+    descending = request.args.get('order') == 'desc'
+    # 並び順の列のあとに企業名と id を足して、行の順番を一意にする
+    keys = [(column, descending) for column in dict.fromkeys([DASHBOARD_SORTS[sort], DashboardCompany.name, DashboardCompany.company_id])]
+    query = db.select(DashboardCompany).where(DashboardCompany.user_id == current_user.id, *conditions, *facet_conditions.values())
+
+    # 通常は 1 クエリ。日付が変わって「次の面接」が古くなった行があるときだけ更新して読み直す
+    companies, next_cursor = list_page(query, keys, app.config['DASHBOARD_PAGE_SIZE'], scalars=True)
+    since = today_start()
+    if any(company.next_interview_at and to_app_tz(company.next_interview_at) < since for company in companies):
+        refresh_next_interviews(current_user.id, since)
+        db.session.commit()
+        companies, next_cursor = list_page(query, keys, app.config['DASHBOARD_PAGE_SIZE'], scalars=True)
     return render_template(
-        'dashboard.html', 
-        companies=companies, 
-        calendar_events=json.dumps(calendar_events)
+        'dashboard.html', companies=companies, next_cursor=next_cursor,
+        facets=dashboard_facets(conditions, facet_conditions, filters),
+        filters=filters, sort=sort, order='desc' if descending else 'asc'
     )
 
+# --- 企業名・業界の入力補完 ---
+# ユーザーごとの前方一致インデックス (autocomplete.PrefixIndex) をプロセス内に持ち、入力のたびに DB を読まずに候補を返す。
+# このプロセスでの企業の追加・変更・削除はコミット後にインデックスへ反映し、他のワーカーでの変更は
+# AUTOCOMPLETE_TTL 秒ごとにインデックスを読み直して反映する
+AUTOCOMPLETE_FIELDS = ('name', 'industry')
+AUTOCOMPLETE_LIMIT = 10
+autocomplete_indexes = LRUCache(maxsize=1000, ttl=app.config['AUTOCOMPLETE_TTL'])
+autocomplete_lock = threading.Lock()
+
+def _autocomplete_terms(company, old=False):
+    # インデックスに入れる {欄: (値, 読み)}。old なら flush 前の値 (読み込まれていなければ None)
+    state = db.inspect(company)
+    values = {}
+    for name in ('name', 'name_kana', 'industry'):
+        history = state.attrs[name].history
+        if old and history.added:
+            if not history.deleted:
+                return None
+            values[name] = history.deleted[0]
+        else:
+            values[name] = getattr(company, name)
+    return {'name': (values['name'], values['name_kana']), 'industry': (values['industry'], None)}
+
+def autocomplete_index(user_id):
+    # ユーザーのインデックス {欄: PrefixIndex}。このプロセスに無ければ企業の一覧から作る (1 クエリ)
+    indexes = autocomplete_indexes.get(user_id)
+    if indexes is None:
+        indexes = {field: PrefixIndex() for field in AUTOCOMPLETE_FIELDS}
+        rows = db.session.execute(
+            db.select(Company.name, Company.name_kana, Company.industry).where(Company.user_id == user_id)
+        )
+        for name, name_kana, industry in rows:
+            indexes['name'].add(name, name_kana)
+            indexes['industry'].add(industry)
+        autocomplete_indexes.set(user_id, indexes)
+    return indexes
+
+@db.event.listens_for(db.session, 'after_flush')
+def collect_autocomplete_changes(db_session, flush_context):
+    # 企業の変更を (user_id, 外す値, 入れる値) として控えておき、コミットされたらインデックスに反映する
+    changes = db_session.info.setdefault('autocomplete_changes', [])
+    for obj in changed_objects(db_session):
+        if not isinstance(obj, Company):
+            continue
+        if obj in db_session.new:
+            changes.append((obj.user_id, {}, _autocomplete_terms(obj)))
+        elif obj in db_session.deleted:
+            changes.append((obj.user_id, _autocomplete_terms(obj), {}))
+        else:
+            changes.append((obj.user_id, _autocomplete_terms(obj, old=True), _autocomplete_terms(obj)))
+
+@db.event.listens_for(db.session, 'after_commit')
+def apply_autocomplete_changes(db_session):
+    for user_id, removed, added in db_session.info.pop('autocomplete_changes', []):
+        indexes = autocomplete_indexes.get(user_id)
+        if indexes is None:
+            continue
+        if removed is None:
+            # 変更前の値がわからないときは捨てて、次の入力補完で読み直す
+            autocomplete_indexes.delete(user_id)
+            continue
+        with autocomplete_lock:
+            for field, (value, reading) in removed.items():
+                indexes[field].remove(value, reading)
+            for field, (value, reading) in added.items():
+                indexes[field].add(value, reading)
+
+@db.event.listens_for(db.session, 'after_rollback')
+def discard_autocomplete_changes(db_session):
+    db_session.info.pop('autocomplete_changes', None)
+
+@app.route('/autocomplete/<field>')
+@login_required
+@query_budget(1)
+def autocomplete(field):
+    # 登録済みの企業名 (読みでも探せる) または業界のうち、q で始まるものを多く使われている順に返す
+    if field not in AUTOCOMPLETE_FIELDS:
+        abort(404)
+    indexes = autocomplete_index(current_user.id)
+    with autocomplete_lock:
+        values = indexes[field].search(request.args.get('q', ''), AUTOCOMPLETE_LIMIT)
+    return jsonify(values)
+
+# --- カレンダー関連のルート ---
+# 予定の種類ごとのタイトル接頭辞と表示色
+CALENDAR_KINDS = {
+    'application': ('応募', '#28a745'),
+    'interview': ('面接', '#dc3545'),
+    'task': ('タスク〆', '#ffc107'),
+    'document': ('書類提出', '#17a2b8'),
+}
+
+def _parse_range_param(name):
+    # FullCalendar は start/end を ISO8601 (例: 2025-06-01T00:00:00+09:00) で送ってくる
+    value = request.args.get(name, '')
+    try:
+        return datetime.strptime(value[:10], '%Y-%m-%d').date()
+    except ValueError:
+        abort(400)
+
+def _calendar_event(event):
+    prefix, color = CALENDAR_KINDS[event.kind]
+    return {
+        'title': f"{prefix}: {event.title}",
+        # 日付のみの予定は終日、面接は日本時間の時刻付きで返す
+        'start': to_app_tz(event.starts_at).isoformat() if event.starts_at else event.start_day.isoformat(),
+        'url': url_for('company_detail', company_id=event.company_id) if event.company_id else '#',
+        'backgroundColor': color,
+        'borderColor': color,
+        'textColor': 'black'
+    }
+
+@app.route('/calendar/events')
+@login_required
+@etag_by_data_version
+@query_budget(1)
+def calendar_events():
+    # 表示中の期間 [start, end) に含まれる予定だけを、作り直し済みの calendar_event から返す
+    start = _parse_range_param('start')
+    end = _parse_range_param('end')
+    events = db.session.execute(
+        db.select(CalendarEvent.kind, CalendarEvent.title, CalendarEvent.start_day, CalendarEvent.starts_at, CalendarEvent.company_id)
+        .where(CalendarEvent.user_id == current_user.id, CalendarEvent.start_day >= start, CalendarEvent.start_day < end)
+    ).all()
+    return jsonify([_calendar_event(event) for event in events])
+
+# 企業詳細ページの各一覧: (モデル, 表示する列, 並び順)
+COMPANY_SECTIONS = {
+    'interviews': (Interview, ('date_time', 'location', 'person', 'url', 'notes'), Interview.date_time.desc()),
+    'tasks': (Task, ('content', 'deadline', 'status'), Task.deadline),
+    'documents': (Document, ('document_name', 'submission_date', 'status', 'file_path'), Document.document_name),
+    'memos': (Memo, ('title', 'content'), Memo.title),
+}
+COMPANY_SECTION_ROWS = {
+    section: namedtuple(f'{model.__name__}Row', ('id',) + columns)
+    for section, (model, columns, _) in COMPANY_SECTIONS.items()
+}
+
+SECTION_BY_MODEL = {model: section for section, (model, _, _) in COMPANY_SECTIONS.items()}
+
+# 一覧では先頭の EXCERPT_LENGTH 文字だけを表示する列。全文は「全文を表示」で読み込む
+EXCERPT_LENGTH = 200
+EXCERPT_COLUMNS = {'interviews': 'notes', 'memos': 'content'}
+app.jinja_env.globals['EXCERPT_LENGTH'] = EXCERPT_LENGTH
+
+def excerpt(column):
+    # 1 文字多く読んで、切り詰めたかどうかをテンプレートで判定できるようにする
+    return db.func.substr(column, 1, EXCERPT_LENGTH + 1)
+
+@db.event.listens_for(db.session, 'after_flush')
+def bump_section_versions(db_session, flush_context):
+    # 面接・タスク・書類・メモが変わった企業の、その一覧のバージョンだけを増やす
+    company_ids = {section: set() for section in COMPANY_SECTIONS}
+    for obj in changed_objects(db_session):
+        section = SECTION_BY_MODEL.get(type(obj))
+        if section is None:
+            continue
+        company_ids[section].add(obj.company_id)
+        # 別の企業に付け替えられた場合は、元の企業の一覧も変わる
+        company_ids[section].update(db.inspect(obj).attrs.company_id.history.deleted)
+    companies = Company.__table__
+    for section, ids in company_ids.items():
+        ids.discard(None)
+        if ids:
+            column = companies.c[f'{section}_version']
+            db_session.connection().execute(companies.update().where(companies.c.id.in_(ids)).values({column: column + 1}))
+
+def _section_column(section, name, type_):
+    model, columns, _ = COMPANY_SECTIONS[section]
+    if name not in columns:
+        return db.cast(db.null(), type_)
+    if EXCERPT_COLUMNS.get(section) == name:
+        return excerpt(getattr(model, name))
+    return getattr(model, name)
+
+def load_company_sections(company_id, sections=None):
+    # 面接・タスク・書類・メモ (sections で指定したもの) を UNION ALL で 1 回のクエリにまとめて取得する。
+    # 各一覧の並び順は row_number() で付けた position で保ち、一覧ごとの軽量な行のリストを返す。
+    # メモの本文などの長いテキストは先頭だけ (excerpt) を読む
+    sections = list(sections or COMPANY_SECTIONS)
+    all_columns = {}
+    for section in sections:
+        model, columns, _ = COMPANY_SECTIONS[section]
+        for name in columns:
+            all_columns.setdefault(name, getattr(model, name).type)
+
+    selects = []
+    for section in sections:
+        model, columns, order_by = COMPANY_SECTIONS[section]
+        selects.append(db.select(
+            db.literal(section).label('section'),
+            db.func.row_number().over(order_by=order_by).label('position'),
+            model.id.label('id'),
+            *[
+                _section_column(section, name, type_).label(name)
+                for name, type_ in all_columns.items()
+            ]
+        ).where(model.company_id == company_id))
+    query = db.union_all(*selects).subquery()
+
+    rows = {section: [] for section in sections}
+    for row in db.session.execute(db.select(query).order_by(query.c.section, query.c.position)):
+        row_type = COMPANY_SECTION_ROWS[row.section]
+        rows[row.section].append(row_type(*(getattr(row, field) for field in row_type._fields)))
+    return rows
+
+def company_section_keys(company):
+    # 一覧ごとの描画済み HTML のキャッシュキー。持ち主と企業の cache_token を含めるので、
+    # 別のユーザーや、同じ id を再利用した別の企業のキャッシュとは重ならない
+    return {
+        section: (
+            f"company:{company.user_id}:{company.id}:{company.cache_token}:{section}:"
+            f"{getattr(company, f'{section}_version')}:{SOURCE_VERSION}"
+        )
+        for section in COMPANY_SECTIONS
+    }
+
+def render_company_sections(company):
+    # 一覧ごとに描画済みの HTML をキャッシュする。キーに一覧のバージョンを含めるので、
+    # メモを編集してもメモの一覧だけが描画し直され、データの読み込みもキャッシュにない一覧の分だけになる
+    keys = company_section_keys(company)
+    html = {section: fragment_cache.get(key) for section, key in keys.items()}
+    missing = [section for section, value in html.items() if value is None]
+    if missing:
+        for section, section_rows in load_company_sections(company.id, missing).items():
+            html[section] = render_template(f'_company_{section}.html', company=company, **{section: section_rows})
+            fragment_cache.set(keys[section], html[section])
+    return {section: Markup(value) for section, value in html.items()}
+
 @app.route('/company/<int:company_id>')
 @login_required
+@etag_by_data_version
+@query_budget(2)
 def company_detail(company_id):
-    company = Company.query.filter_by(id=company_id, user_id=current_user.id).first_or_404()
-    
-    interviews = Interview.query.filter_by(company_id=company.id).order_by(Interview.date_time.desc()).all()
-    tasks = Task.query.filter_by(company_id=company.id).order_by(Task.deadline).all()
-    documents = Document.query.filter_by(company_id=company.id).order_by(Document.document_name).all()
-    memos = Memo.query.filter_by(company_id=company.id).order_by(Memo.title).all()
+    company = Company.query.options(db.undefer(Company.notes)).filter_by(id=company_id, user_id=current_user.id).first_or_404()
+    return render_company_detail(company)
 
-    return render_template(
-        'company_detail.html',
-        company=company,
-        interviews=interviews,
-        tasks=tasks,
-        documents=documents,
-        memos=memos
-    )
+def render_company_detail(company):
+    # 企業詳細ページ (追加・編集フォームの入力が正しくなかったときは、保存せずにこのページを表示し直す)
+    return render_template('company_detail.html', company=company, sections=render_company_sections(company))
 
 # --- 企業情報の編集・削除 ---
 @app.route('/company/<int:company_id>/edit', methods=['POST'])
 @login_required
 def edit_company(company_id):
     company = Company.query.filter_by(id=company_id, user_id=current_user.id).first_or_404()
+    try:
+        application_date = form_date('application_date', '応募日')
+    except InvalidFormValue as exc:
+        flash(str(exc), 'danger')
+        return render_company_detail(company)
     company.name = request.form.get('name')
+    company.name_kana = request.form.get('name_kana')
     company.industry = request.form.get('industry')
     company.url = request.form.get('url')
     company.notes = request.form.get('notes')
-    company.application_date = request.form.get('application_date')
+    company.application_date = application_date
     company.selection_stage = request.form.get('selection_stage')
     company.result = request.form.get('result')
     db.session.commit()
@@ -266,8 +1239,12 @@ def edit_company(company_id):
 @login_required
 def delete_company(company_id):
     company = Company.query.filter_by(id=company_id, user_id=current_user.id).first_or_404()
+    keys = company_section_keys(company)
     db.session.delete(company)
     db.session.commit()
+    # もう表示されないキャッシュを残さない
+    for key in keys.values():
+        fragment_cache.delete(key)
     flash('企業情報を削除しました', 'success')
     return redirect(url_for('dashboard'))
 
@@ -276,10 +1253,15 @@ def delete_company(company_id):
 @login_required
 def add_interview(company_id):
     company = Company.query.filter_by(id=company_id, user_id=current_user.id).first_or_404()
+    try:
+        date_time = form_datetime('date_time', '日時')
+    except InvalidFormValue as exc:
+        flash(str(exc), 'danger')
+        return render_company_detail(company)
     new_interview = Interview(
         company_id=company.id,
         user_id=current_user.id,
-        date_time=request.form.get('date_time'),
+        date_time=date_time,
         location=request.form.get('location'),
         person=request.form.get('person'),
         url=request.form.get('url'),
@@ -290,13 +1272,59 @@ def add_interview(company_id):
     flash('面接情報を追加しました', 'success')
     return redirect(url_for('company_detail', company_id=company.id))
 
+@app.route('/interviews', methods=['GET', 'POST'])
+@login_required
+@etag_by_data_version
+@query_budget(2)
+def interview_list():
+    # 今日 (日本時間) 以降の面接を日時の早い順に並べ、(日時, id) のカーソルで先へ読み進める。
+    # (user_id, date_time) のインデックスで読むので、過去の面接が増えても 1 ページのコストは変わらない
+    if request.method == 'POST':
+        company_id = company_id_from_form(required=True)
+        try:
+            date_time = form_datetime('date_time', '日時')
+        except InvalidFormValue as exc:
+            # 保存せずに、入力した内容を残したままフォームを表示し直す
+            flash(str(exc), 'danger')
+        else:
+            new_interview = Interview(
+                company_id=company_id,
+                user_id=current_user.id,
+                date_time=date_time,
+                location=request.form.get('location'),
+                person=request.form.get('person'),
+                url=request.form.get('url'),
+                notes=request.form.get('notes')
+            )
+            db.session.add(new_interview)
+            db.session.commit()
+            flash('面接情報を追加しました', 'success')
+            return redirect(url_for('interview_list'))
+
+    query = (
+        db.select(Interview, Company.name, excerpt(Interview.notes).label('notes'))
+        .join(Company, Interview.company_id == Company.id)
+        .where(Interview.user_id == current_user.id, Interview.date_time >= today_start())
+    )
+    interviews, next_cursor = list_page(
+        query, [(Interview.date_time, False), (Interview.id, False)],
+        cursor_values=lambda row: [row.Interview.date_time, row.Interview.id]
+    )
+    return render_template('interviews.html', interviews=interviews, next_cursor=next_cursor, companies=company_choices())
+
 @app.route('/interview/<int:interview_id>/edit', methods=['GET', 'POST'])
 @login_required
+@etag_by_data_version
 def edit_interview(interview_id):
-    interview = Interview.query.filter_by(id=interview_id, user_id=current_user.id).first_or_404()
+    interview = Interview.query.options(db.undefer(Interview.notes)).filter_by(id=interview_id, user_id=current_user.id).first_or_404()
     company = Company.query.filter_by(id=interview.company_id, user_id=current_user.id).first_or_404()
     if request.method == 'POST':
-        interview.date_time = request.form.get('date_time')
+        try:
+            date_time = form_datetime('date_time', '日時')
+        except InvalidFormValue as exc:
+            flash(str(exc), 'danger')
+            return render_template('edit_interview.html', interview=interview, company=company)
+        interview.date_time = date_time
         interview.location = request.form.get('location')
         interview.person = request.form.get('person')
         interview.url = request.form.get('url')
@@ -306,6 +1334,19 @@ def edit_interview(interview_id):
         return redirect(url_for('company_detail', company_id=company.id))
     return render_template('edit_interview.html', interview=interview, company=company)
 
+@app.route('/interview/<int:interview_id>/notes')
+@login_required
+@etag_by_data_version
+@query_budget(1)
+def interview_notes(interview_id):
+    # 企業詳細ページで切り詰めて表示している面接メモの全文
+    row = db.session.execute(
+        db.select(Interview.notes).where(Interview.id == interview_id, Interview.user_id == current_user.id)
+    ).first()
+    if row is None:
+        abort(404)
+    return jsonify({'text': row.notes or ''})
+
 @app.route('/interview/<int:interview_id>/delete', methods=['POST'])
 @login_required
 def delete_interview(interview_id):
@@ -323,11 +1364,16 @@ def add_task(company_id):
     company = Company.query.filter_by(id=company_id, user_id=current_user.id).first_or_404()
     content = request.form.get('content')
     if content:
+        try:
+            deadline = form_date('deadline', '期限')
+        except InvalidFormValue as exc:
+            flash(str(exc), 'danger')
+            return render_company_detail(company)
         new_task = Task(
             user_id=current_user.id,
             company_id=company.id,
             content=content,
-            deadline=request.form.get('deadline'),
+            deadline=deadline,
             status='未完了'
         )
         db.session.add(new_task)
@@ -335,6 +1381,52 @@ def add_task(company_id):
         flash('タスクを追加しました', 'success')
     return redirect(url_for('company_detail', company_id=company.id))
 
+@app.route('/tasks', methods=['GET', 'POST'])
+@login_required
+@etag_by_data_version
+@query_budget(2)
+def task_list():
+    # すべての企業のタスク (企業に紐付かないものも含む) を期限の早い順に並べる。
+    # 状態での絞り込みは (user_id, status, deadline)、状態を問わない場合は (user_id, deadline) のインデックスで読む
+    if request.method == 'POST':
+        content = request.form.get('content')
+        company_id = company_id_from_form()
+        try:
+            deadline = form_date('deadline', '期限')
+        except InvalidFormValue as exc:
+            # 保存せずに、入力した内容を残したままフォームを表示し直す
+            flash(str(exc), 'danger')
+        else:
+            if content:
+                new_task = Task(
+                    user_id=current_user.id,
+                    company_id=company_id,
+                    content=content,
+                    deadline=deadline,
+                    status='未完了'
+                )
+                db.session.add(new_task)
+                db.session.commit()
+                flash('タスクを追加しました', 'success')
+            return redirect(url_for('task_list'))
+
+    filters = {'status': request.args.get('status', '未完了'), 'due': request.args.get('due', '')}
+    conditions = [Task.user_id == current_user.id]
+    if filters['status'] in ('未完了', '完了'):
+        conditions.append(Task.status == filters['status'])
+    conditions.extend(due_window_conditions(Task.deadline, filters['due']))
+    query = (
+        db.select(Task, Company.name)
+        .outerjoin(Company, Task.company_id == Company.id)
+        .where(*conditions)
+        .options(db.undefer(Task.content))
+    )
+    tasks, next_cursor = list_page(
+        query, [(Task.deadline, False), (Task.id, False)],
+        cursor_values=lambda row: [row.Task.deadline, row.Task.id]
+    )
+    return render_template('tasks.html', tasks=tasks, next_cursor=next_cursor, filters=filters, companies=company_choices())
+
 @app.route('/task/<int:task_id>/toggle', methods=['POST'])
 @login_required
 def toggle_task(task_id):
@@ -343,16 +1435,22 @@ def toggle_task(task_id):
     task.status = '完了' if task.status == '未完了' else '未完了'
     db.session.commit()
     flash('タスクの状態を更新しました', 'success')
-    return redirect(url_for('company_detail', company_id=company_id))
+    return redirect_back(url_for('company_detail', company_id=company_id) if company_id else url_for('task_list'))
 
 @app.route('/task/<int:task_id>/edit', methods=['GET', 'POST'])
 @login_required
+@etag_by_data_version
 def edit_task(task_id):
-    task = Task.query.filter_by(id=task_id, user_id=current_user.id).first_or_404()
+    task = Task.query.options(db.undefer(Task.content)).filter_by(id=task_id, user_id=current_user.id).first_or_404()
     company = Company.query.filter_by(id=task.company_id, user_id=current_user.id).first_or_404() if task.company_id else None
     if request.method == 'POST':
+        try:
+            deadline = form_date('deadline', '期限')
+        except InvalidFormValue as exc:
+            flash(str(exc), 'danger')
+            return render_template('edit_task.html', task=task, company=company)
         task.content = request.form.get('content')
-        task.deadline = request.form.get('deadline')
+        task.deadline = deadline
         task.status = request.form.get('status')
         db.session.commit()
         flash('タスクを更新しました', 'success')
@@ -374,11 +1472,16 @@ def delete_task(task_id):
 @login_required
 def add_document(company_id):
     company = Company.query.filter_by(id=company_id, user_id=current_user.id).first_or_404()
+    try:
+        submission_date = form_date('submission_date', '提出日')
+    except InvalidFormValue as exc:
+        flash(str(exc), 'danger')
+        return render_company_detail(company)
     new_document = Document(
         user_id=current_user.id,
         company_id=company.id,
         document_name=request.form.get('document_name'),
-        submission_date=request.form.get('submission_date'),
+        submission_date=submission_date,
         status=request.form.get('status'),
         file_path=request.form.get('file_path')
     )
@@ -387,14 +1490,73 @@ def add_document(company_id):
     flash('書類情報を追加しました', 'success')
     return redirect(url_for('company_detail', company_id=company.id))
 
+# 提出が済んだ書類の状況 (企業詳細ページの入力欄の例と同じ)
+SUBMITTED_STATUS = '提出済み'
+# 提出日がこの日数以内の未提出の書類を「まもなく」として表示する
+DUE_SOON_DAYS = 7
+
+@app.route('/documents', methods=['GET', 'POST'])
+@login_required
+@etag_by_data_version
+@query_budget(2)
+def document_list():
+    # すべての企業の書類を提出日の早い順に並べる (期限切れ → まもなく → それ以降 → 提出日なし)。
+    # 既定では提出済みの書類を除く。状況を指定した場合は (user_id, status, submission_date) のインデックスで読む
+    if request.method == 'POST':
+        document_name = request.form.get('document_name')
+        company_id = company_id_from_form()
+        try:
+            submission_date = form_date('submission_date', '提出日')
+        except InvalidFormValue as exc:
+            # 保存せずに、入力した内容を残したままフォームを表示し直す
+            flash(str(exc), 'danger')
+        else:
+            if document_name:
+                new_document = Document(
+                    user_id=current_user.id,
+                    company_id=company_id,
+                    document_name=document_name,
+                    submission_date=submission_date,
+                    status=request.form.get('status'),
+                    file_path=request.form.get('file_path')
+                )
+                db.session.add(new_document)
+                db.session.commit()
+                flash('書類情報を追加しました', 'success')
+            return redirect(url_for('document_list'))
+
+    filters = {'show': request.args.get('show', 'pending'), 'due': request.args.get('due', '')}
+    conditions = [Document.user_id == current_user.id]
+    if filters['show'] == 'pending':
+        conditions.append(db.or_(Document.status.is_(None), Document.status != SUBMITTED_STATUS))
+    elif filters['show'] == 'submitted':
+        conditions.append(Document.status == SUBMITTED_STATUS)
+    conditions.extend(due_window_conditions(Document.submission_date, filters['due']))
+    query = db.select(Document, Company.name).outerjoin(Company, Document.company_id == Company.id).where(*conditions)
+    documents, next_cursor = list_page(
+        query, [(Document.submission_date, False), (Document.id, False)],
+        cursor_values=lambda row: [row.Document.submission_date, row.Document.id]
+    )
+    today = today_start().date()
+    return render_template(
+        'documents.html', documents=documents, next_cursor=next_cursor, filters=filters, companies=company_choices(),
+        today=today, due_soon=today + timedelta(days=DUE_SOON_DAYS), submitted_status=SUBMITTED_STATUS
+    )
+
 @app.route('/document/<int:document_id>/edit', methods=['GET', 'POST'])
 @login_required
+@etag_by_data_version
 def edit_document(document_id):
     document = Document.query.filter_by(id=document_id, user_id=current_user.id).first_or_404()
     company = Company.query.filter_by(id=document.company_id, user_id=current_user.id).first_or_404() if document.company_id else None
     if request.method == 'POST':
+        try:
+            submission_date = form_date('submission_date', '提出日')
+        except InvalidFormValue as exc:
+            flash(str(exc), 'danger')
+            return render_template('edit_document.html', document=document, company=company)
         document.document_name = request.form.get('document_name')
-        document.submission_date = request.form.get('submission_date')
+        document.submission_date = submission_date
         document.status = request.form.get('status')
         document.file_path = request.form.get('file_path')
         db.session.commit()
@@ -430,10 +1592,50 @@ def add_memo(company_id):
         flash('メモを追加しました', 'success')
     return redirect(url_for('company_detail', company_id=company.id))
 
+@app.route('/memos', methods=['GET', 'POST'])
+@login_required
+@etag_by_data_version
+@query_budget(2)
+def memo_list():
+    # すべての企業のメモをタイトル順に並べる。本文は先頭だけ (excerpt) を読み、全文は「全文を表示」で読み込む。
+    # (user_id, title) または企業で絞り込んだ場合は (company_id, title) のインデックスで読む
+    if request.method == 'POST':
+        title = request.form.get('title')
+        if title:
+            new_memo = Memo(
+                user_id=current_user.id,
+                company_id=company_id_from_form(),
+                title=title,
+                content=request.form.get('content')
+            )
+            db.session.add(new_memo)
+            db.session.commit()
+            flash('メモを追加しました', 'success')
+        return redirect(url_for('memo_list'))
+
+    filters = {'q': request.args.get('q', '').strip(), 'company_id': request.args.get('company_id', type=int)}
+    conditions = [Memo.user_id == current_user.id]
+    if filters['q']:
+        conditions.append(Memo.title.contains(filters['q'], autoescape=True))
+    if filters['company_id'] is not None:
+        conditions.append(Memo.company_id == filters['company_id'])
+    query = (
+        db.select(Memo, Company.name, excerpt(Memo.content).label('content'))
+        .outerjoin(Company, Memo.company_id == Company.id)
+        .where(*conditions)
+    )
+    memos, next_cursor = list_page(
+        query, [(Memo.title, False), (Memo.id, False)],
+        cursor_values=lambda row: [row.Memo.title, row.Memo.id]
+    )
+    filters = {name: value for name, value in filters.items() if value}
+    return render_template('memos.html', memos=memos, next_cursor=next_cursor, filters=filters, companies=company_choices())
+
 @app.route('/memo/<int:memo_id>/edit', methods=['GET', 'POST'])
 @login_required
+@etag_by_data_version
 def edit_memo(memo_id):
-    memo = Memo.query.filter_by(id=memo_id, user_id=current_user.id).first_or_404()
+    memo = Memo.query.options(db.undefer(Memo.content)).filter_by(id=memo_id, user_id=current_user.id).first_or_404()
     company = Company.query.filter_by(id=memo.company_id, user_id=current_user.id).first_or_404() if memo.company_id else None
     if request.method == 'POST':
         memo.title = request.form.get('title')
@@ -443,6 +1645,19 @@ def edit_memo(memo_id):
         return redirect(url_for('company_detail', company_id=company.id) if company else url_for('dashboard'))
     return render_template('edit_memo.html', memo=memo, company=company)
 
+@app.route('/memo/<int:memo_id>/content')
+@login_required
+@etag_by_data_version
+@query_budget(1)
+def memo_content(memo_id):
+    # 企業詳細ページで切り詰めて表示しているメモの本文 (全文)
+    row = db.session.execute(
+        db.select(Memo.content).where(Memo.id == memo_id, Memo.user_id == current_user.id)
+    ).first()
+    if row is None:
+        abort(404)
+    return jsonify({'html': row.content})
+
 @app.route('/memo/<int:memo_id>/delete', methods=['POST'])
 @login_required
 def delete_memo(memo_id):
@@ -453,6 +1668,378 @@ def delete_memo(memo_id):
     flash('メモを削除しました', 'success')
     return redirect(url_for('company_detail', company_id=company_id) if company_id else url_for('dashboard'))
 
+# --- 選考状況の集計 ---
+# 選考の段階 (この順に進む)。これ以外の選考段階は段階ごとの件数にだけ出し、通過率には含めない
+SELECTION_STAGES = ('書類選考', '一次面接', '二次面接', '三次面接', '最終面接')
+OFFER_RESULT = '内定'
+# 企業の編集フォームで候補に出す
+app.jinja_env.globals['SELECTION_STAGES'] = SELECTION_STAGES
+
+def _week_start(column):
+    # 日付をその週の月曜日にそろえる
+    if db.engine.dialect.name == 'postgresql':
+        return db.cast(db.func.date_trunc('week', column), db.Date)
+    return db.type_coerce(db.func.date(column, 'weekday 0', '-6 days'), db.Date)
+
+def selection_analytics(user_id):
+    # 段階ごとの件数、段階間の通過率、週ごとの応募数。読み取りモデルの GROUP BY 2 回で集計し、
+    # fragment_cache に入れられるよう JSON にできる値だけで返す
+    stage_rows = db.session.execute(
+        db.select(DashboardCompany.selection_stage, DashboardCompany.result, db.func.count())
+        .where(DashboardCompany.user_id == user_id)
+        .group_by(DashboardCompany.selection_stage, DashboardCompany.result)
+    ).all()
+    week = _week_start(DashboardCompany.application_date).label('week')
+    week_rows = db.session.execute(
+        db.select(week, db.func.count())
+        .where(DashboardCompany.user_id == user_id, DashboardCompany.application_date.isnot(None))
+        .group_by(week).order_by(week)
+    ).all()
+
+    stages = {}
+    for stage, result, count in stage_rows:
+        row = stages.setdefault(stage or '', {'stage': stage or '未設定', 'total': 0, 'active': 0, 'offers': 0, 'closed': 0})
+        row['total'] += count
+        if not result:
+            row['active'] += count
+        elif result == OFFER_RESULT:
+            row['offers'] += count
+        else:
+            row['closed'] += count
+    order = {stage: i for i, stage in enumerate(SELECTION_STAGES)}
+    stage_list = sorted(stages.values(), key=lambda row: (order.get(row['stage'], len(order)), -row['total'], row['stage']))
+
+    # 各段階に到達した企業 = その段階以降にいる企業 + 内定した企業 (段階が何であっても最後まで進んだとみなす)
+    offers = sum(row['offers'] for row in stages.values())
+    funnel = []
+    for i, stage in enumerate(SELECTION_STAGES):
+        reached = sum(
+            row['total'] - row['offers'] for key, row in stages.items()
+            if order.get(key, -1) >= i
+        ) + offers
+        funnel.append({'stage': stage, 'reached': reached})
+    funnel.append({'stage': OFFER_RESULT, 'reached': offers})
+    for previous, row in zip([None] + funnel, funnel):
+        row['rate'] = row['reached'] / previous['reached'] if previous and previous['reached'] else None
+
+    # 応募のなかった週も 0 件として並べる
+    weeks = []
+    counts = dict(week_rows)
+    if counts:
+        day, last = min(counts), max(counts)
+        while day <= last:
+            weeks.append({'week': day.isoformat(), 'count': counts.get(day, 0)})
+            day += timedelta(days=7)
+
+    return {
+        'total': sum(row['total'] for row in stages.values()),
+        'stages': stage_list,
+        'funnel': funnel,
+        'weeks': weeks,
+    }
+
+def _count_duration(connection, user_id, kind, stage, days):
+    # ヒストグラムの件数を 1 増やす (行がなければ作る)。
+    # bump_data_version が user 行をロックした後に実行されるので、同じユーザーの更新が競合することはない
+    durations = StageDuration.__table__
+    key = (durations.c.user_id == user_id, durations.c.kind == kind, durations.c.stage == stage, durations.c.days == days)
+    updated = connection.execute(durations.update().where(*key).values(count=durations.c.count + 1))
+    if updated.rowcount == 0:
+        connection.execute(durations.insert().values(user_id=user_id, kind=kind, stage=stage, days=days, count=1))
+
+def _days_between(start, end):
+    return (to_app_tz(end).date() - to_app_tz(start).date()).days
+
+@db.event.listens_for(db.session, 'after_flush')
+def record_stage_transitions(db_session, flush_context):
+    # 追加・変更された企業の選考段階・結果が変わっていれば履歴に 1 行追記し、
+    # 抜けた段階の滞在日数と、内定までの日数をヒストグラムに数える
+    connection = None
+    now = datetime.now(APP_TZ)
+    for obj in changed_objects(db_session):
+        if not isinstance(obj, Company) or obj in db_session.deleted:
+            continue
+        state = db.inspect(obj)
+        old = {}
+        for name in ('selection_stage', 'result'):
+            history = state.attrs[name].history
+            old[name] = (history.deleted[0] if history.deleted else None) if history.added else getattr(obj, name)
+        from_stage, from_result = old['selection_stage'] or None, old['result'] or None
+        to_stage, to_result = obj.selection_stage or None, obj.result or None
+        if obj in db_session.new:
+            from_stage = from_result = None
+        if (from_stage, from_result) == (to_stage, to_result):
+            continue
+
+        connection = connection or db_session.connection()
+        transitions = StageTransition.__table__
+        previous = connection.execute(
+            db.select(transitions.c.changed_at, transitions.c.stage_entered_at)
+            .where(transitions.c.company_id == obj.id)
+            .order_by(transitions.c.changed_at.desc(), transitions.c.id.desc()).limit(1)
+        ).first()
+        stage_changed = from_stage != to_stage
+        connection.execute(transitions.insert().values(
+            user_id=obj.user_id, company_id=obj.id,
+            from_stage=from_stage, to_stage=to_stage, from_result=from_result, to_result=to_result,
+            changed_at=now,
+            stage_entered_at=now if stage_changed or previous is None else previous.stage_entered_at,
+        ))
+        # 段階が変わったとき、または結果が出て選考が終わったときに、それまでの段階にいた日数を数える
+        # (段階に入った日時がわからない、履歴を記録する前からの段階は数えない)
+        if previous is not None and from_stage and (stage_changed or (to_result and not from_result)):
+            _count_duration(connection, obj.user_id, 'stage', from_stage, _days_between(previous.stage_entered_at, now))
+        if to_result == OFFER_RESULT and from_result != OFFER_RESULT and obj.application_date:
+            days = (now.date() - obj.application_date).days
+            if days >= 0:
+                _count_duration(connection, obj.user_id, 'offer', '', days)
+
+def histogram_median(counts):
+    # [(日数, 件数), ...] (日数の昇順) の中央値
+    total = sum(count for _, count in counts)
+    if not total:
+        return None
+    middle = [(total - 1) // 2, total // 2]
+    values = []
+    seen = 0
+    for days, count in counts:
+        while middle and middle[0] < seen + count:
+            values.append(days)
+            middle.pop(0)
+        seen += count
+    return sum(values) / len(values)
+
+def stage_durations(user_id):
+    # 段階ごとの滞在日数と内定までの日数の (件数, 中央値)。ヒストグラムを 1 回読むだけで出す
+    histograms = {}
+    for kind, stage, days, count in db.session.execute(
+        db.select(StageDuration.kind, StageDuration.stage, StageDuration.days, StageDuration.count)
+        .where(StageDuration.user_id == user_id)
+        .order_by(StageDuration.kind, StageDuration.stage, StageDuration.days)
+    ):
+        histograms.setdefault((kind, stage), []).append((days, count))
+    order = {stage: i for i, stage in enumerate(SELECTION_STAGES)}
+    stages = sorted(
+        (stage for kind, stage in histograms if kind == 'stage'),
+        key=lambda stage: (order.get(stage, len(order)), stage)
+    )
+    def summarize(counts):
+        return {'count': sum(count for _, count in counts), 'median': histogram_median(counts)}
+    return {
+        'stages': [dict(stage=stage, **summarize(histograms['stage', stage])) for stage in stages],
+        'offer': summarize(histograms.get(('offer', ''), [])),
+    }
+
+@app.route('/analytics')
+@login_required
+@etag_by_data_version
+@query_budget(3)
+def analytics():
+    # 集計結果はデータバージョンごとにキャッシュする (何か変更されるまでは集計し直さない)。
+    # 集計結果の形はコードとともに変わるので、SOURCE_VERSION も含める
+    key = f'analytics:{current_user.id}:{g.data_version}:{SOURCE_VERSION}'
+    summary = fragment_cache.get(key)
+    if summary is None:
+        summary = dict(selection_analytics(current_user.id), durations=stage_durations(current_user.id))
+        fragment_cache.set(key, summary)
+    return render_template('analytics.html', summary=summary)
+
+# --- 全文検索 ---
+# 索引にするデータ: 種類 -> (モデル, 企業の id, 見出し, 本文の列, HTML として保存されている列)
+SearchSource = namedtuple('SearchSource', ('model', 'company_id', 'title', 'columns', 'html'))
+SEARCH_SOURCES = {
+    'company': SearchSource(Company, Company.id, Company.name, (Company.name, Company.notes), None),
+    'interview': SearchSource(Interview, Interview.company_id, Interview.person, (Interview.person, Interview.notes), None),
+    'task': SearchSource(Task, Task.company_id, Task.content, (Task.content,), None),
+    'memo': SearchSource(Memo, Memo.company_id, Memo.title, (Memo.title, Memo.content), Memo.content),
+}
+SEARCH_KIND_BY_MODEL = {source.model: kind for kind, source in SEARCH_SOURCES.items()}
+# 検索結果の種類ごとの表示名と、元のデータを開く URL
+SEARCH_KINDS = {
+    'company': ('企業', lambda row: url_for('company_detail', company_id=row.source_id)),
+    'interview': ('面接', lambda row: url_for('edit_interview', interview_id=row.source_id)),
+    'task': ('タスク', lambda row: url_for('edit_task', task_id=row.source_id)),
+    'memo': ('メモ', lambda row: url_for('edit_memo', memo_id=row.source_id)),
+}
+
+def _search_row(user_id, kind, source, row):
+    texts = []
+    for column, value in zip(source.columns, row[3:]):
+        if value and column is source.html:
+            value = Markup(value).striptags()
+        texts.append(value or '')
+    body = '\n'.join(texts)
+    return {
+        'user_id': user_id,
+        'kind': kind,
+        'source_id': row[0],
+        'company_id': row[1],
+        'title': (row[2] or SEARCH_KINDS[kind][0])[:100],
+        'body': body,
+        'grams': ' '.join(index_tokens(body)),
+    }
+
+def refresh_search_documents(connection, user_id, ids_by_kind=None):
+    # ids_by_kind ({種類: id の集合}) の索引を元のデータから作り直す。None ならユーザーのすべて
+    documents = SearchDocument.__table__
+    if ids_by_kind is None:
+        connection.execute(documents.delete().where(documents.c.user_id == user_id))
+    rows = []
+    for kind, source in SEARCH_SOURCES.items():
+        condition = source.model.user_id == user_id
+        if ids_by_kind is not None:
+            ids = ids_by_kind.get(kind)
+            if not ids:
+                continue
+            connection.execute(documents.delete().where(documents.c.kind == kind, documents.c.source_id.in_(ids)))
+            condition = db.and_(condition, source.model.id.in_(ids))
+        query = db.select(source.model.id, source.company_id, source.title, *source.columns).where(condition)
+        rows.extend(_search_row(user_id, kind, source, row) for row in connection.execute(query))
+    if rows:
+        connection.execute(documents.insert(), rows)
+
+@db.event.listens_for(db.session, 'after_flush')
+def refresh_search_documents_on_flush(db_session, flush_context):
+    # 追加・変更・削除されたデータの索引だけを作り直す (削除されたものは元のデータがないので消えるだけ)
+    targets = {}
+    for obj in changed_objects(db_session):
+        kind = SEARCH_KIND_BY_MODEL.get(type(obj))
+        if kind is not None:
+            targets.setdefault(obj.user_id, {}).setdefault(kind, set()).add(obj.id)
+    for user_id, ids_by_kind in targets.items():
+        refresh_search_documents(db_session.connection(), user_id, ids_by_kind)
+
+def rebuild_search_documents(engine, user_ids=None):
+    # 全文検索の索引をユーザー (省略時は全ユーザー) ごとに作り直す。rebuild_read_models と同じ進め方
+    if user_ids is None:
+        with engine.connect() as connection:
+            user_ids = connection.execute(db.select(User.id).order_by(User.id)).scalars().all()
+    for user_id in user_ids:
+        with engine.begin() as connection:
+            connection.execute(db.select(User.id).where(User.id == user_id).with_for_update())
+            refresh_search_documents(connection, user_id)
+    return len(user_ids)
+
+def search_matches(user_id, tokens):
+    # 全トークンを含む文書と、その関連度 (rank: 大きいほど上位) のクエリ
+    columns = (
+        SearchDocument.id, SearchDocument.kind, SearchDocument.source_id, SearchDocument.title,
+        SearchDocument.body, Company.name.label('company_name')
+    )
+    if db.engine.dialect.name == 'postgresql':
+        terms = ' & '.join(f"'{token}'" + (':*' if prefix else '') for token, prefix in tokens)
+        tsquery = db.func.to_tsquery(db.literal_column("'simple'::regconfig"), terms)
+        query = db.select(*columns, db.func.ts_rank(SEARCH_VECTOR, tsquery, type_=db.Float).label('rank')).where(
+            SEARCH_VECTOR.op('@@')(tsquery)
+        )
+    else:
+        fts = db.table('search_document_fts', db.column('rowid'))
+        terms = ' '.join(f'"{token}"' + ('*' if prefix else '') for token, prefix in tokens)
+        # bm25 は小さいほど関連が強い
+        query = db.select(*columns, (-db.func.bm25(db.literal_column(fts.name), type_=db.Float)).label('rank')).join_from(
+            fts, SearchDocument, fts.c.rowid == SearchDocument.id
+        ).where(db.literal_column(fts.name).op('MATCH')(terms))
+    return query.outerjoin(Company, SearchDocument.company_id == Company.id).where(SearchDocument.user_id == user_id)
+
+@app.route('/search')
+@login_required
+@etag_by_data_version
+@query_budget(1)
+def search():
+    # メモ・企業・タスク・面接をまとめて検索し、関連度の高い順に (関連度, id) のカーソルでページングする
+    q = request.args.get('q', '').strip()
+    tokens = query_tokens(q)
+    if not tokens:
+        return render_template('search.html', q=q, results=[], next_cursor=None)
+
+    matches = search_matches(current_user.id, tokens).subquery()
+    rows, next_cursor = list_page(db.select(matches), [(matches.c.rank, True), (matches.c.id, False)])
+    results = [
+        {
+            'kind': SEARCH_KINDS[row.kind][0],
+            'url': SEARCH_KINDS[row.kind][1](row),
+            'title': row.title,
+            'company_name': row.company_name,
+            'snippet': snippet(row.body, q),
+        }
+        for row in rows
+    ]
+    return render_template('search.html', q=q, results=results, next_cursor=next_cursor)
+
+
+# --- 差分同期 ---
+# クライアントが手元に持っているデータを、前回の同期以降に追加・変更・削除された行だけで更新するための API
+SYNC_MODELS = {'company': Company, 'interview': Interview, 'task': Task, 'document': Document, 'memo': Memo}
+SYNC_KIND_BY_MODEL = {model: kind for kind, model in SYNC_MODELS.items()}
+# 同期で返さない列 (描画済み HTML のキャッシュキーなど、サーバー内部の値)
+SYNC_EXCLUDED_COLUMNS = {'user_id', 'interviews_version', 'tasks_version', 'documents_version', 'memos_version', 'cache_token'}
+# 更新日時はコミットより前 (flush の時点) に決まるので、前回の同期の時点でまだコミットされていなかった変更を
+# 取りこぼさないよう、前回の同期時刻からこれだけさかのぼって読む
+SYNC_OVERLAP = timedelta(minutes=1)
+
+@db.event.listens_for(db.session, 'before_flush')
+def touch_updated_at(db_session, flush_context, instances):
+    # 変更された行の更新日時を進める (追加された行は列の既定値で入る)
+    now = now_in_app_tz()
+    for obj in db_session.dirty:
+        if isinstance(obj, USER_DATA_MODELS) and db_session.is_modified(obj):
+            obj.updated_at = now
+
+@db.event.listens_for(db.session, 'after_flush')
+def record_deleted_rows(db_session, flush_context):
+    rows = [
+        {'user_id': obj.user_id, 'kind': SYNC_KIND_BY_MODEL[type(obj)], 'source_id': obj.id, 'deleted_at': now_in_app_tz()}
+        for obj in db_session.deleted if isinstance(obj, USER_DATA_MODELS)
+    ]
+    if rows:
+        db_session.connection().execute(DeletedRecord.__table__.insert(), rows)
+
+def _sync_value(value):
+    if isinstance(value, datetime):
+        return to_app_tz(value).isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+@app.route('/sync')
+@login_required
+@etag_by_data_version
+@query_budget(6)
+def sync():
+    # cursor (前回の応答の cursor) 以降に追加・変更された行と、削除された行の id を種類ごとに返す。
+    # cursor がなければ全件 (削除の記録は不要なので返さない)。SYNC_OVERLAP の分は前回と同じ行が返ることがあるので、
+    # クライアントは id で上書き・削除すること
+    since = None
+    if request.args.get('cursor'):
+        try:
+            since, = decode_cursor(request.args['cursor'], [(DeletedRecord.deleted_at, False)])
+        except InvalidCursor:
+            abort(400)
+        # decode_cursor は null を None に戻すので、日時でなければ壊れた cursor として扱う
+        if not isinstance(since, datetime):
+            abort(400)
+        since -= SYNC_OVERLAP
+    synced_at = now_in_app_tz()
+
+    changes = {}
+    for kind, model in SYNC_MODELS.items():
+        table = model.__table__
+        query = db.select(*(column for column in table.c if column.key not in SYNC_EXCLUDED_COLUMNS)).where(table.c.user_id == current_user.id)
+        if since is not None:
+            query = query.where(table.c.updated_at >= since)
+        changes[kind] = [
+            {key: _sync_value(value) for key, value in row._mapping.items()}
+            for row in db.session.execute(query.order_by(table.c.id))
+        ]
+    deleted = {kind: [] for kind in SYNC_MODELS}
+    if since is not None:
+        for kind, source_id in db.session.execute(
+            db.select(DeletedRecord.kind, DeletedRecord.source_id)
+            .where(DeletedRecord.user_id == current_user.id, DeletedRecord.deleted_at >= since)
+            .order_by(DeletedRecord.id)
+        ):
+            deleted[kind].append(source_id)
+    return jsonify(cursor=encode_cursor([synced_at]), changes=changes, deleted=deleted)
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
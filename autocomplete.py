@@ -0,0 +1,61 @@
+# 企業名・業界の入力補完に使う、ユーザーごとのプロセス内の前方一致インデックス。
+# 値と読み (ふりがな) を正規化したキーを並べたリストを持ち、bisect で前方一致の範囲を探すので、
+# 1 回の検索は DB にも問い合わせず、件数の対数 + 候補数の時間で終わる。
+import bisect
+import unicodedata
+from collections import Counter
+
+# カタカナ (ァ-ヶ) をひらがなに揃える
+_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(ord('ァ'), ord('ヶ') + 1)}
+
+
+def normalize(text):
+    # 全角・半角、大文字・小文字、カタカナ・ひらがなの違いを無視し、空白を取り除く
+    text = unicodedata.normalize('NFKC', text or '').lower().translate(_KATAKANA_TO_HIRAGANA)
+    return ''.join(text.split())
+
+
+class PrefixIndex:
+    # 値 (企業名や業界) を、値そのものと読みの前方一致で探す。
+    # 同じ値を持つ企業の数を数えておき、多く使われている値ほど上位に出す (表記の揺れを減らすため)
+    def __init__(self):
+        self._keys = []
+        self._pairs = Counter()
+        self._values = Counter()
+
+    def __len__(self):
+        return len(self._values)
+
+    def add(self, value, reading=None):
+        if not value:
+            return
+        self._values[value] += 1
+        for key in {normalize(value), normalize(reading)} - {''}:
+            if self._pairs[key, value] == 0:
+                bisect.insort(self._keys, (key, value))
+            self._pairs[key, value] += 1
+
+    def remove(self, value, reading=None):
+        if not value or not self._values[value]:
+            return
+        self._values[value] -= 1
+        if not self._values[value]:
+            del self._values[value]
+        for key in {normalize(value), normalize(reading)} - {''}:
+            self._pairs[key, value] -= 1
+            if self._pairs[key, value] <= 0:
+                del self._pairs[key, value]
+                position = bisect.bisect_left(self._keys, (key, value))
+                if position < len(self._keys) and self._keys[position] == (key, value):
+                    del self._keys[position]
+
+    def search(self, prefix, limit=10):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        found = set()
+        position = bisect.bisect_left(self._keys, (prefix,))
+        while position < len(self._keys) and self._keys[position][0].startswith(prefix):
+            found.add(self._keys[position][1])
+            position += 1
+        return sorted(found, key=lambda value: (-self._values[value], normalize(value), value))[:limit]
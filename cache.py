@@ -0,0 +1,274 @@
+# アプリ内で使うキャッシュ。
+# どのバックエンドも get(key) / set(key, value, ttl=None) / delete(key) / stats() を持つ:
+#   LRUCache         プロセス内 (gunicorn のワーカーごとに別々)
+#   FileSystemCache  ディレクトリ内のファイル (同じホストのワーカー間で共有)
+#   RedisCache       Redis プロトコルを話すサーバー (Redis 互換のサーバーなら何でもよい)
+# LRUCache 以外は値を JSON で保存するので、JSON にできる値だけを入れること
+import hashlib
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlparse
+
+
+class LRUCache:
+    # プロセス内の LRU キャッシュ。ttl (秒) を指定すると古いエントリは期限切れになる。
+    # gunicorn ではワーカーごとに別々のキャッシュを持つので、他のワーカーでの変更は ttl が過ぎるまで反映されない
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {'backend': 'memory', 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'size': len(self._entries)}
+
+
+class FileSystemCache:
+    # 1 エントリを 1 ファイルに保存する。書き込みは一時ファイルからの rename なので、
+    # 複数のワーカーが同時に読み書きしても壊れたファイルを読むことはない。
+    # ファイル数が maxsize を超えたら、更新日時の古いものから削除する (件数は prune_interval 回の set ごとに確認)
+    def __init__(self, directory, maxsize=10000, ttl=None, prune_interval=100):
+        self.directory = directory
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.prune_interval = prune_interval
+        os.makedirs(directory, exist_ok=True)
+        self._sets = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + '.json')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        if entry['expires_at'] is not None and entry['expires_at'] <= time.time():
+            self.delete(key)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry['value']
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        entry = {'expires_at': time.time() + ttl if ttl is not None else None, 'value': value}
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(temp_path, self._path(key))
+        self._sets += 1
+        if self._sets % self.prune_interval == 0:
+            self._prune()
+
+    def _prune(self):
+        paths = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                try:
+                    paths.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    continue
+        paths.sort()
+        for _, path in paths[:max(0, len(paths) - self.maxsize)]:
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except OSError:
+                pass
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def stats(self):
+        # hits / misses / evictions はこのプロセスでの件数
+        return {'backend': 'filesystem', 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisCache:
+    # Redis プロトコル (RESP) で GET / SET / DEL を送るだけの小さなクライアント。
+    # サーバーに接続できないときはキャッシュなしとして動く (get は None、set は何もしない)。
+    # 失敗した後 retry_after 秒はサーバーに接続しに行かない
+    def __init__(self, host='localhost', port=6379, db=0, password=None, ttl=None, timeout=0.5, prefix='syukatsu:', retry_after=5):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.ttl = ttl
+        self.timeout = timeout
+        self.prefix = prefix
+        self.retry_after = retry_after
+        self._down_until = 0
+        self._local = threading.local()
+        self.hits = self.misses = self.errors = 0
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        conn = (sock, sock.makefile('rb'))
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        if self.password:
+            self._send(conn, 'AUTH', self.password)
+        if self.db:
+            self._send(conn, 'SELECT', self.db)
+        return conn
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._connect()
+        return conn
+
+    def _send(self, conn, *args):
+        sock, reader = conn
+        parts = [f'*{len(args)}\r\n'.encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        sock.sendall(b''.join(parts))
+        return self._read(reader)
+
+    def _read(self, reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError('Redis の接続が切れました')
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode()
+        if kind == b'-':
+            raise RedisError(payload.decode())
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            return reader.read(length + 2)[:-2]
+        if kind == b'*':
+            length = int(payload)
+            return None if length < 0 else [self._read(reader) for _ in range(length)]
+        raise RedisError(f'不明な応答です: {line!r}')
+
+    def command(self, *args):
+        if time.monotonic() < self._down_until:
+            raise ConnectionError('Redis に接続できないため再試行を待っています')
+        try:
+            try:
+                return self._send(self._connection(), *args)
+            except (OSError, ConnectionError):
+                # 接続が切れていたら 1 回だけつなぎ直す
+                self._local.conn = None
+                return self._send(self._connection(), *args)
+        except (OSError, ConnectionError):
+            self._local.conn = None
+            self._down_until = time.monotonic() + self.retry_after
+            raise
+
+    def get(self, key):
+        try:
+            data = self.command('GET', self.prefix + key)
+        except (OSError, ConnectionError, RedisError):
+            self.errors += 1
+            return None
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(data)
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        args = ['SET', self.prefix + key, json.dumps(value, ensure_ascii=False).encode()]
+        if ttl is not None:
+            args += ['EX', int(ttl)]
+        try:
+            self.command(*args)
+        except (OSError, ConnectionError, RedisError):
+            self.errors += 1
+
+    def delete(self, key):
+        try:
+            self.command('DEL', self.prefix + key)
+        except (OSError, ConnectionError, RedisError):
+            self.errors += 1
+
+    def stats(self):
+        # hits / misses はこのプロセスでの件数、evictions はサーバー全体の evicted_keys
+        stats = {'backend': 'redis', 'hits': self.hits, 'misses': self.misses, 'errors': self.errors}
+        try:
+            info = self.command('INFO', 'stats').decode()
+            for line in info.splitlines():
+                if line.startswith('evicted_keys:'):
+                    stats['evictions'] = int(line.split(':', 1)[1])
+        except (OSError, ConnectionError, RedisError):
+            self.errors += 1
+        return stats
+
+
+def make_cache(url, ttl=None):
+    # CACHE_URL からバックエンドを作る:
+    #   memory://?maxsize=1000   file:///var/cache/syukatsu?maxsize=10000   redis://:password@host:6379/0
+    parsed = urlparse(url)
+    options = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+    if parsed.scheme == 'memory':
+        return LRUCache(maxsize=int(options.get('maxsize', 1024)), ttl=ttl)
+    if parsed.scheme == 'file':
+        return FileSystemCache(parsed.path, maxsize=int(options.get('maxsize', 10000)), ttl=ttl)
+    if parsed.scheme == 'redis':
+        return RedisCache(
+            host=parsed.hostname or 'localhost',
+            port=parsed.port or 6379,
+            db=int(parsed.path.lstrip('/') or 0),
+            password=parsed.password,
+            ttl=ttl
+        )
+    raise ValueError(f'対応していないキャッシュの URL です: {url}')
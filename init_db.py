@@ -1,11 +1,22 @@
 from app import app, db
+import migrations
 
 # アプリケーションコンテキスト内でデータベース操作を実行する
 with app.app_context():
     print("データベースのテーブルを初期化します...")
-    
+
+    # 新規のデータベースかどうかは、テーブル作成前に確認しておく
+    fresh = not migrations.has_table(db.engine, 'user')
+
     # app.pyで定義されている全てのモデル（User, Company, Taskなど）に基づいて
     # テーブルを作成します。すでにテーブルが存在する場合は、作成されません。
     db.create_all()
-    
-    print("データベースのテーブル初期化が完了しました。")
\ No newline at end of file
+
+    if fresh:
+        # create_all で最新のスキーマになっているので、マイグレーションは適用済みとして記録する
+        migrations.stamp(db.engine)
+    else:
+        # 既存のテーブルは create_all では変更されないため、未適用のマイグレーションを実行する
+        migrations.upgrade(db.engine)
+
+    print("データベースのテーブル初期化が完了しました。")
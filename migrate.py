@@ -0,0 +1,35 @@
+# データベースのマイグレーションを実行する。
+#   python migrate.py status              適用状況を表示
+#   python migrate.py upgrade [VERSION]   VERSION (省略時は最新) まで適用
+#   python migrate.py downgrade [VERSION] VERSION より新しいものを取り消す (省略時は最新の 1 つ)
+#   python migrate.py stamp [VERSION]     実行せずに適用済みとして記録
+import argparse
+
+from app import app, db
+import migrations
+
+
+def main():
+    parser = argparse.ArgumentParser(description='データベースのマイグレーション')
+    parser.add_argument('command', choices=['status', 'upgrade', 'downgrade', 'stamp'])
+    parser.add_argument('version', nargs='?', help='対象のバージョン (例: 0002)')
+    args = parser.parse_args()
+
+    with app.app_context():
+        engine = db.engine
+        if args.command == 'status':
+            for migration, applied in migrations.status(engine):
+                print(f"[{'x' if applied else ' '}] {migration.version}_{migration.name}")
+        elif args.command == 'upgrade':
+            done = migrations.upgrade(engine, args.version)
+            print(f'{len(done)} 件のマイグレーションを適用しました。')
+        elif args.command == 'downgrade':
+            done = migrations.downgrade(engine, args.version)
+            print(f'{len(done)} 件のマイグレーションを取り消しました。')
+        elif args.command == 'stamp':
+            migrations.stamp(engine, args.version)
+            print('適用済みとして記録しました。')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# 文字列で保存していた日付・日時の列を DATE / TIMESTAMP WITH TIME ZONE に変更する。
+# 既存の値 (2025/06/20, 2025-06-15T14:00 など) は app.parse_date / parse_datetime で正規化する。
+# 解釈できなかった値は NULL になるので、表示される一覧を確認して手で直すこと。
+import sqlalchemy as sa
+
+from app import parse_date, parse_datetime, to_app_tz
+from migrations import column_type, convert_column, create_index, drop_index
+
+COLUMNS = [
+    ('company', 'application_date', sa.Date(), parse_date),
+    ('interview', 'date_time', sa.DateTime(timezone=True), parse_datetime),
+    ('task', 'deadline', sa.Date(), parse_date),
+    ('document', 'submission_date', sa.Date(), parse_date),
+]
+
+INDEXES = [
+    ('ix_company_user_application_date', 'company', ['user_id', 'application_date']),
+    ('ix_interview_user_date_time', 'interview', ['user_id', 'date_time']),
+    ('ix_task_user_deadline', 'task', ['user_id', 'deadline']),
+    ('ix_document_user_submission_date', 'document', ['user_id', 'submission_date']),
+]
+
+
+def _format_date(value):
+    # SQLite では DATE 列も文字列のまま返ってくる
+    if isinstance(value, str):
+        value = parse_date(value)
+    return value.isoformat() if value else None
+
+
+def _format_datetime(value):
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    return to_app_tz(value).strftime('%Y-%m-%dT%H:%M') if value else None
+
+
+def upgrade(engine):
+    for table, column, new_type, convert in COLUMNS:
+        if not isinstance(column_type(engine, table, column), sa.String):
+            continue  # create_all で作成済みのテーブルはすでに日付型
+        failures = convert_column(engine, table, column, new_type, convert)
+        for row_id, raw in failures:
+            print(f'  {table}.{column} id={row_id}: 日付として解釈できない値 {raw!r} を NULL にしました')
+    for name, table, columns in INDEXES:
+        create_index(engine, name, table, columns)
+
+
+def downgrade(engine):
+    for name, _, _ in INDEXES:
+        drop_index(engine, name)
+    for table, column, new_type, _ in COLUMNS:
+        if isinstance(column_type(engine, table, column), sa.String):
+            continue
+        length = 50 if isinstance(new_type, sa.DateTime) else 20
+        convert = _format_datetime if isinstance(new_type, sa.DateTime) else _format_date
+        convert_column(engine, table, column, sa.String(length), convert)
@@ -0,0 +1,26 @@
+# 各テーブルの実際の検索パターンに合わせた複合インデックスを追加する。
+#   (user_id, name)               ダッシュボードの企業一覧
+#   (user_id, status, deadline)   カレンダーの未完了タスク
+#   (company_id, ...)             企業詳細ページの各一覧 (並び順の列まで含める)
+# Postgres では CREATE INDEX CONCURRENTLY で作成するので、稼働中のテーブルへの書き込みは止まらない。
+from migrations import create_index, drop_index
+
+INDEXES = [
+    ('ix_company_user_name', 'company', ['user_id', 'name']),
+    ('ix_interview_company_date_time', 'interview', ['company_id', 'date_time']),
+    ('ix_task_user_status_deadline', 'task', ['user_id', 'status', 'deadline']),
+    ('ix_task_company_deadline', 'task', ['company_id', 'deadline']),
+    ('ix_document_company_document_name', 'document', ['company_id', 'document_name']),
+    ('ix_memo_user_title', 'memo', ['user_id', 'title']),
+    ('ix_memo_company_title', 'memo', ['company_id', 'title']),
+]
+
+
+def upgrade(engine):
+    for name, table, columns in INDEXES:
+        create_index(engine, name, table, columns)
+
+
+def downgrade(engine):
+    for name, _, _ in INDEXES:
+        drop_index(engine, name)
@@ -0,0 +1,13 @@
+# ユーザーごとのデータバージョン (企業・面接・タスク・書類・メモを変更するたびに 1 増える) を追加する。
+# GET ページの ETag に使う。
+import sqlalchemy as sa
+
+from migrations import add_column, drop_column
+
+
+def upgrade(engine):
+    add_column(engine, 'user', 'data_version', sa.Integer(), default=0, nullable=False)
+
+
+def downgrade(engine):
+    drop_column(engine, 'user', 'data_version')
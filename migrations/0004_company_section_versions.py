@@ -0,0 +1,17 @@
+# 企業詳細ページの各一覧 (面接・タスク・書類・メモ) のバージョンを追加する。
+# 一覧ごとの描画済み HTML のキャッシュキーに使う。
+import sqlalchemy as sa
+
+from migrations import add_column, drop_column
+
+COLUMNS = ['interviews_version', 'tasks_version', 'documents_version', 'memos_version']
+
+
+def upgrade(engine):
+    for column in COLUMNS:
+        add_column(engine, 'company', column, sa.Integer(), default=0, nullable=False)
+
+
+def downgrade(engine):
+    for column in COLUMNS:
+        drop_column(engine, 'company', column)
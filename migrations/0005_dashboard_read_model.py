@@ -0,0 +1,14 @@
+# ダッシュボードの読み取りモデル (dashboard_company, calendar_event) のテーブルを作り、既存のデータから埋める。
+# 新しいテーブルなので、インデックスもテーブルと一緒に作る。
+from app import CalendarEvent, DashboardCompany, db, rebuild_read_models
+
+TABLES = [DashboardCompany.__table__, CalendarEvent.__table__]
+
+
+def upgrade(engine):
+    db.metadata.create_all(engine, tables=TABLES)
+    rebuild_read_models(engine)
+
+
+def downgrade(engine):
+    db.metadata.drop_all(engine, tables=TABLES)
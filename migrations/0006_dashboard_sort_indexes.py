@@ -0,0 +1,20 @@
+# ダッシュボードの企業一覧の並べ替え・絞り込み用のインデックスを dashboard_company に追加する。
+# (user_id, 列, name) の順にして、列での絞り込みと企業名順のページングにも使えるようにする。
+from migrations import create_index, drop_index
+
+INDEXES = [
+    ('ix_dashboard_company_user_industry', 'dashboard_company', ['user_id', 'industry', 'name']),
+    ('ix_dashboard_company_user_selection_stage', 'dashboard_company', ['user_id', 'selection_stage', 'name']),
+    ('ix_dashboard_company_user_result', 'dashboard_company', ['user_id', 'result', 'name']),
+    ('ix_dashboard_company_user_application_date', 'dashboard_company', ['user_id', 'application_date', 'name']),
+]
+
+
+def upgrade(engine):
+    for name, table, columns in INDEXES:
+        create_index(engine, name, table, columns)
+
+
+def downgrade(engine):
+    for name, _, _ in INDEXES:
+        drop_index(engine, name)
@@ -0,0 +1,10 @@
+# 書類一覧を状況で絞り込み、提出日順に読むためのインデックスを追加する。
+from migrations import create_index, drop_index
+
+
+def upgrade(engine):
+    create_index(engine, 'ix_document_user_status_submission_date', 'document', ['user_id', 'status', 'submission_date'])
+
+
+def downgrade(engine):
+    drop_index(engine, 'ix_document_user_status_submission_date')
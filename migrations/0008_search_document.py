@@ -0,0 +1,14 @@
+# 全文検索の索引 (search_document) を作り、既存のデータから埋める。
+# Postgres では GIN インデックス、SQLite では FTS5 の仮想テーブルとトリガーもテーブルと一緒に作られる。
+from app import SearchDocument, db, rebuild_search_documents
+
+TABLES = [SearchDocument.__table__]
+
+
+def upgrade(engine):
+    db.metadata.create_all(engine, tables=TABLES)
+    rebuild_search_documents(engine)
+
+
+def downgrade(engine):
+    db.metadata.drop_all(engine, tables=TABLES)
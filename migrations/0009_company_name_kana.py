@@ -0,0 +1,12 @@
+# 企業名の読み (ふりがな) を追加する。企業名の入力補完で、読みの前方一致でも候補を出すために使う。
+import sqlalchemy as sa
+
+from migrations import add_column, drop_column
+
+
+def upgrade(engine):
+    add_column(engine, 'company', 'name_kana', sa.String(100))
+
+
+def downgrade(engine):
+    drop_column(engine, 'company', 'name_kana')
@@ -0,0 +1,13 @@
+# 選考段階・結果の変更履歴 (stage_transition) と、滞在日数のヒストグラム (stage_duration) のテーブルを作る。
+# 履歴はこれ以降の変更から記録する (それより前にいつ段階が変わったかはわからないので埋めない)。
+from app import StageDuration, StageTransition, db
+
+TABLES = [StageTransition.__table__, StageDuration.__table__]
+
+
+def upgrade(engine):
+    db.metadata.create_all(engine, tables=TABLES)
+
+
+def downgrade(engine):
+    db.metadata.drop_all(engine, tables=TABLES)
@@ -0,0 +1,26 @@
+# 差分同期 (/sync) のために、企業・面接・タスク・書類・メモに作成・更新日時と (user_id, updated_at) のインデックスを、
+# 削除の記録 (deleted_record) のテーブルを追加する。
+# 既存の行の日時は NULL のまま (全件の同期には含まれ、それ以降の差分同期では変更されたときに返る)。
+import sqlalchemy as sa
+
+from app import DeletedRecord, db
+from migrations import add_column, create_index, drop_column, drop_index
+
+TABLES = ['company', 'interview', 'task', 'document', 'memo']
+COLUMNS = ['created_at', 'updated_at']
+
+
+def upgrade(engine):
+    for table in TABLES:
+        for column in COLUMNS:
+            add_column(engine, table, column, sa.DateTime(timezone=True))
+        create_index(engine, f'ix_{table}_user_updated_at', table, ['user_id', 'updated_at'])
+    db.metadata.create_all(engine, tables=[DeletedRecord.__table__])
+
+
+def downgrade(engine):
+    db.metadata.drop_all(engine, tables=[DeletedRecord.__table__])
+    for table in TABLES:
+        drop_index(engine, f'ix_{table}_user_updated_at')
+        for column in COLUMNS:
+            drop_column(engine, table, column)
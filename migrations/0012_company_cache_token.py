@@ -0,0 +1,19 @@
+# 企業ごとのランダムな cache_token を追加する。企業詳細ページの描画済み HTML のキャッシュキーに含め、
+# 削除した企業の id が再利用されたときに以前の企業のキャッシュを表示しないようにする。
+# 既存の行にも行ごとに違う値をバッチで入れる。
+import sqlalchemy as sa
+
+from migrations import add_column, drop_column, is_postgres, update_in_batches
+
+
+def upgrade(engine):
+    add_column(engine, 'company', 'cache_token', sa.String(32))
+    if is_postgres(engine):
+        token = 'md5(random()::text || clock_timestamp()::text || id::text)'
+    else:
+        token = 'lower(hex(randomblob(16)))'
+    update_in_batches(engine, 'company', f'cache_token = {token}', 'cache_token IS NULL')
+
+
+def downgrade(engine):
+    drop_column(engine, 'company', 'cache_token')
@@ -0,0 +1,285 @@
+# スキーマ変更 (マイグレーション) の実行と、マイグレーションから使う共通処理。
+#
+# マイグレーションはこのディレクトリの NNNN_説明.py で、upgrade(engine) と downgrade(engine) を持つ。
+# 適用済みのバージョンは schema_migrations テーブルに記録する。実行は migrate.py から行う。
+#
+# 本番の Postgres をロックし続けないよう、
+#   - データの書き換えは小さなバッチに分けて短いトランザクションで行う (backfill_in_batches, update_in_batches)
+#   - インデックスは CONCURRENTLY で作成する (create_index)
+# マイグレーション自体は 1 つずつ独立したトランザクションではなく、必要な単位で自分でコミットする。
+import importlib
+import os
+import re
+from datetime import datetime, timezone
+
+import sqlalchemy as sa
+
+BATCH_SIZE = 500
+VERSION_TABLE = 'schema_migrations'
+# 複数のインスタンスが同時にマイグレーションを実行しないための advisory lock のキー
+LOCK_KEY = 7310402
+
+_FILENAME = re.compile(r'^(\d{4})_(\w+)\.py$')
+
+
+class Migration:
+    def __init__(self, version, name):
+        self.version = version
+        self.name = name
+
+    @property
+    def module(self):
+        return importlib.import_module(f'{__name__}.{self.version}_{self.name}')
+
+    def __repr__(self):
+        return f'<Migration {self.version}_{self.name}>'
+
+
+def discover():
+    directory = os.path.dirname(__file__)
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = _FILENAME.match(filename)
+        if match:
+            migrations.append(Migration(*match.groups()))
+    return migrations
+
+
+def _version_table(engine):
+    with engine.begin() as connection:
+        connection.execute(sa.text(
+            f'CREATE TABLE IF NOT EXISTS {VERSION_TABLE} ('
+            'version VARCHAR(4) PRIMARY KEY, name VARCHAR(100) NOT NULL, applied_at TIMESTAMP NOT NULL)'
+        ))
+
+
+def applied_versions(engine):
+    _version_table(engine)
+    with engine.connect() as connection:
+        return {row[0] for row in connection.execute(sa.text(f'SELECT version FROM {VERSION_TABLE}'))}
+
+
+def _record(engine, migration):
+    with engine.begin() as connection:
+        connection.execute(
+            sa.text(f'INSERT INTO {VERSION_TABLE} (version, name, applied_at) VALUES (:version, :name, :applied_at)'),
+            {'version': migration.version, 'name': migration.name, 'applied_at': datetime.now(timezone.utc).replace(tzinfo=None)}
+        )
+
+
+def _forget(engine, migration):
+    with engine.begin() as connection:
+        connection.execute(sa.text(f'DELETE FROM {VERSION_TABLE} WHERE version = :version'), {'version': migration.version})
+
+
+class _migration_lock:
+    # Postgres ではセッション単位の advisory lock で同時実行を防ぐ (SQLite は単一プロセス前提)
+    def __init__(self, engine):
+        self.engine = engine
+        self.connection = None
+
+    def __enter__(self):
+        if is_postgres(self.engine):
+            self.connection = self.engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+            self.connection.execute(sa.text('SELECT pg_advisory_lock(:key)'), {'key': LOCK_KEY})
+        return self
+
+    def __exit__(self, *exc):
+        if self.connection is not None:
+            self.connection.execute(sa.text('SELECT pg_advisory_unlock(:key)'), {'key': LOCK_KEY})
+            self.connection.close()
+
+
+def status(engine):
+    applied = applied_versions(engine)
+    return [(migration, migration.version in applied) for migration in discover()]
+
+
+def upgrade(engine, target=None, log=print):
+    # target (例: '0002') までの未適用のマイグレーションを順に適用する。省略時は最新まで
+    with _migration_lock(engine):
+        applied = applied_versions(engine)
+        done = []
+        for migration in discover():
+            if target is not None and migration.version > target:
+                break
+            if migration.version in applied:
+                continue
+            log(f'upgrade {migration.version}_{migration.name} ...')
+            migration.module.upgrade(engine)
+            _record(engine, migration)
+            done.append(migration)
+        return done
+
+
+def downgrade(engine, target=None, log=print):
+    # target より新しい適用済みのマイグレーションを新しい順に取り消す。省略時は最新の 1 つだけ
+    with _migration_lock(engine):
+        applied = applied_versions(engine)
+        candidates = [m for m in reversed(discover()) if m.version in applied]
+        if target is None:
+            candidates = candidates[:1]
+        else:
+            candidates = [m for m in candidates if m.version > target]
+        for migration in candidates:
+            log(f'downgrade {migration.version}_{migration.name} ...')
+            migration.module.downgrade(engine)
+            _forget(engine, migration)
+        return candidates
+
+
+def stamp(engine, target=None):
+    # マイグレーションを実行せずに適用済みとして記録する (create_all で最新のスキーマを作った直後など)
+    with _migration_lock(engine):
+        applied = applied_versions(engine)
+        for migration in discover():
+            if target is not None and migration.version > target:
+                break
+            if migration.version not in applied:
+                _record(engine, migration)
+
+
+# --- マイグレーションから使う共通処理 ---
+
+
+def is_postgres(engine):
+    return engine.dialect.name == 'postgresql'
+
+
+def quote(engine, name):
+    # "user" のような予約語のテーブル名を SQL に埋め込めるようにする
+    return engine.dialect.identifier_preparer.quote(name)
+
+
+def has_table(engine, table):
+    return sa.inspect(engine).has_table(table)
+
+
+def column_type(engine, table, column):
+    for info in sa.inspect(engine).get_columns(table):
+        if info['name'] == column:
+            return info['type']
+    return None
+
+
+def backfill_in_batches(engine, table, source, target, convert, target_type, batch_size=BATCH_SIZE):
+    # source 列の値を convert で変換して target 列に書き込む。
+    # id 順に batch_size 件ずつ処理し、バッチごとにコミットするので行ロックはすぐに解放される。
+    # 変換できなかった値は (id, 元の値) のリストとして返す
+    select_batch = sa.text(
+        f'SELECT id, {source} FROM {quote(engine, table)} '
+        f'WHERE id > :last_id AND {source} IS NOT NULL AND {target} IS NULL '
+        f'ORDER BY id LIMIT :limit'
+    )
+    update_row = sa.text(f'UPDATE {quote(engine, table)} SET {target} = :value WHERE id = :id').bindparams(
+        sa.bindparam('value', type_=target_type)
+    )
+    failures = []
+    last_id = 0
+    while True:
+        with engine.begin() as connection:
+            rows = connection.execute(select_batch, {'last_id': last_id, 'limit': batch_size}).all()
+            if not rows:
+                break
+            updates = []
+            for row_id, raw in rows:
+                value = convert(raw)
+                if value is None:
+                    failures.append((row_id, raw))
+                else:
+                    updates.append({'id': row_id, 'value': value})
+            if updates:
+                connection.execute(update_row, updates)
+        last_id = rows[-1][0]
+    return failures
+
+
+def convert_column(engine, table, column, new_type, convert, batch_size=BATCH_SIZE):
+    # 列の型を変更する。ALTER COLUMN TYPE はテーブル全体を書き換える間ロックを取り続けるため、
+    # 「新しい列を追加 → バッチで埋める → 短いトランザクションで差し替え」の順に行う
+    shadow = f'{column}__new'
+    type_sql = new_type.compile(dialect=engine.dialect)
+    if column_type(engine, table, shadow) is None:
+        with engine.begin() as connection:
+            connection.execute(sa.text(f'ALTER TABLE {quote(engine, table)} ADD COLUMN {shadow} {type_sql}'))
+
+    failures = backfill_in_batches(engine, table, column, shadow, convert, new_type, batch_size)
+
+    with engine.begin() as connection:
+        if is_postgres(engine):
+            # バックフィル中にアプリが書き込んだ行を取りこぼさないよう、差し替えの間だけ書き込みを止める
+            connection.execute(sa.text(f'LOCK TABLE {quote(engine, table)} IN SHARE ROW EXCLUSIVE MODE'))
+        rows = connection.execute(sa.text(
+            f'SELECT id, {column} FROM {quote(engine, table)} WHERE {column} IS NOT NULL AND {shadow} IS NULL'
+        )).all()
+        update_row = sa.text(f'UPDATE {quote(engine, table)} SET {shadow} = :value WHERE id = :id').bindparams(
+            sa.bindparam('value', type_=new_type)
+        )
+        for row_id, raw in rows:
+            value = convert(raw)
+            if value is None:
+                if (row_id, raw) not in failures:
+                    failures.append((row_id, raw))
+            else:
+                connection.execute(update_row, {'id': row_id, 'value': value})
+        connection.execute(sa.text(f'ALTER TABLE {quote(engine, table)} DROP COLUMN {column}'))
+        connection.execute(sa.text(f'ALTER TABLE {quote(engine, table)} RENAME COLUMN {shadow} TO {column}'))
+    return failures
+
+
+def create_index(engine, name, table, columns):
+    # Postgres では CONCURRENTLY で作成し、作成中もテーブルへの書き込みを止めない
+    # (CONCURRENTLY はトランザクション内で実行できないため AUTOCOMMIT で流す)
+    concurrently = 'CONCURRENTLY ' if is_postgres(engine) else ''
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        if is_postgres(engine):
+            # 途中で失敗した CONCURRENTLY は無効なインデックスを残すので、作り直す
+            invalid = connection.execute(sa.text(
+                'SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid '
+                'WHERE c.relname = :name AND NOT i.indisvalid'
+            ), {'name': name}).first()
+            if invalid:
+                connection.execute(sa.text(f'DROP INDEX CONCURRENTLY IF EXISTS {name}'))
+        connection.execute(sa.text(
+            f'CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {quote(engine, table)} ({", ".join(columns)})'
+        ))
+
+
+def drop_index(engine, name):
+    concurrently = 'CONCURRENTLY ' if is_postgres(engine) else ''
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(sa.text(f'DROP INDEX {concurrently}IF EXISTS {name}'))
+
+
+def add_column(engine, table, column, column_type_, default=None, nullable=True):
+    # 列がなければ追加する。Postgres 11 以降は定数のデフォルト値付き (NOT NULL も可) でもテーブルを書き換えない
+    if column_type(engine, table, column) is not None:
+        return
+    type_sql = column_type_.compile(dialect=engine.dialect)
+    default_sql = f' DEFAULT {default}' if default is not None else ''
+    null_sql = '' if nullable else ' NOT NULL'
+    with engine.begin() as connection:
+        connection.execute(sa.text(f'ALTER TABLE {quote(engine, table)} ADD COLUMN {column} {type_sql}{default_sql}{null_sql}'))
+
+
+def drop_column(engine, table, column):
+    if column_type(engine, table, column) is None:
+        return
+    with engine.begin() as connection:
+        connection.execute(sa.text(f'ALTER TABLE {quote(engine, table)} DROP COLUMN {column}'))
+
+
+def update_in_batches(engine, table, assignments, where, params=None, batch_size=BATCH_SIZE):
+    # UPDATE table SET assignments WHERE where を batch_size 行ずつ実行する。
+    # where は更新後の行が再び対象にならない条件にすること (例: "col IS NULL")
+    statement = sa.text(
+        f'UPDATE {quote(engine, table)} SET {assignments} WHERE id IN '
+        f'(SELECT id FROM {quote(engine, table)} WHERE {where} ORDER BY id LIMIT :batch_size)'
+    )
+    total = 0
+    while True:
+        with engine.begin() as connection:
+            updated = connection.execute(statement, {**(params or {}), 'batch_size': batch_size}).rowcount
+        total += updated
+        if updated < batch_size:
+            return total
@@ -0,0 +1,94 @@
+# 一覧のキーセットページング (OFFSET を使わず、前のページの最後の行の値から続きを読む)。
+# keys は並び順の [(列, 降順か), ...] で、最後の列は一意 (主キーなど) にすること。
+# NULL はどの値よりも大きいものとして扱う (昇順では末尾、降順では先頭)。Postgres の B-tree の既定の並びと
+# 同じなので、(絞り込みの列, 並び順の列...) のインデックスを昇順・降順のどちらでもそのまま使える。
+import base64
+import json
+from datetime import date, datetime
+
+import sqlalchemy as sa
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def keyset_order(keys):
+    return [
+        column.desc().nulls_first() if descending else column.asc().nulls_last()
+        for column, descending in keys
+    ]
+
+
+def _after(column, descending, value):
+    # (この列だけで見て) value より後ろにある, value と同じ の 2 つの条件
+    if value is None:
+        if descending:
+            return column.isnot(None), column.is_(None)
+        return sa.false(), column.is_(None)
+    if descending:
+        return column < value, column == value
+    return sa.or_(column > value, column.is_(None)), column == value
+
+
+def keyset_after(keys, values):
+    # 並び順で values の行より後ろにある行の条件:
+    #   k1 が後ろ OR (k1 が同じ AND (k2 が後ろ OR (k2 が同じ AND ...)))
+    condition = None
+    for (column, descending), value in reversed(list(zip(keys, values))):
+        later, same = _after(column, descending, value)
+        condition = later if condition is None else sa.or_(later, sa.and_(same, condition))
+    return condition
+
+
+def _to_json(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _from_json(column, value):
+    if value is None:
+        return None
+    python_type = column.type.python_type
+    if python_type in (date, datetime):
+        return python_type.fromisoformat(value)
+    if not isinstance(value, python_type):
+        raise InvalidCursor(f'unexpected value for {column.key}: {value!r}')
+    return value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_to_json(value) for value in values], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, keys):
+    # URL の cursor を keys の各列の型の値に戻す。壊れていれば InvalidCursor
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise InvalidCursor('wrong number of values')
+        return [_from_json(column, value) for (column, _), value in zip(keys, values)]
+    except (ValueError, TypeError) as exc:
+        raise InvalidCursor(str(exc)) from exc
+
+
+def keyset_page(session, query, keys, cursor=None, per_page=50, scalars=False, cursor_values=None):
+    # query の cursor の続きから per_page 件と、次のページの cursor (最後のページなら None) を返す。
+    # 次のページがあるかどうかは 1 件多く読んで判定するので、クエリは 1 回だけ。
+    # 行から keys の値を取り出す方法は cursor_values で変えられる (省略時は列名の属性)
+    if cursor:
+        query = query.where(keyset_after(keys, decode_cursor(cursor, keys)))
+    result = session.execute(query.order_by(*keyset_order(keys)).limit(per_page + 1))
+    rows = result.scalars().all() if scalars else result.all()
+    if len(rows) <= per_page:
+        return rows, None
+    rows = rows[:per_page]
+    last = rows[-1]
+    if cursor_values is None:
+        values = [getattr(last, column.key) for column, _ in keys]
+    else:
+        values = cursor_values(last)
+    return rows, encode_cursor(values)
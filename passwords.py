@@ -0,0 +1,121 @@
+# パスワードのハッシュ化と照合。
+# scrypt は 1 回で数百ミリ秒 CPU を使うため、同じホストで同時に計算する数を HashSlots で制限し、
+# 枠が空かなければ待たずに PasswordHasherBusy を送出する (呼び出し側で 503 などを返す)。
+# workers を指定するとプロセスプールで計算する。ただしリクエストを処理するワーカーは結果を待つので、
+# gunicorn の sync ワーカーでは効果がなく、スレッドや gevent のワーカーで他のリクエストを止めないためのもの
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class PasswordHasherBusy(Exception):
+    # 同時に計算しているハッシュが上限に達していて枠が空かなかった、または計算が時間内に終わらなかった
+    pass
+
+
+class HashSlots:
+    # 同時に計算するハッシュの数の上限。directory 内の slot-N.lock のどれか 1 つの排他ロック (flock) を取れたら計算してよい。
+    # ロックはファイルを閉じるかプロセスが終了すれば外れるので、ワーカーが落ちても枠は残らない。
+    # fcntl のない環境ではプロセス内だけの上限になる
+    def __init__(self, directory, limit, wait=1.0, poll_interval=0.05):
+        self.directory = directory
+        self.limit = limit
+        self.wait = wait
+        self.poll_interval = poll_interval
+        if fcntl is None:
+            self._semaphore = threading.BoundedSemaphore(limit)
+        else:
+            os.makedirs(directory, exist_ok=True)
+
+    def _try_acquire(self):
+        for i in range(self.limit):
+            handle = open(os.path.join(self.directory, f'slot-{i}.lock'), 'a')
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                handle.close()
+                continue
+            return handle.close
+        return None
+
+    def acquire(self):
+        # 枠を 1 つ取り、返す関数を呼ぶと枠を返す。wait 秒待っても空かなければ PasswordHasherBusy
+        if fcntl is None:
+            if not self._semaphore.acquire(timeout=self.wait):
+                raise PasswordHasherBusy('no free password hashing slot')
+            return self._semaphore.release
+        deadline = time.monotonic() + self.wait
+        while True:
+            release = self._try_acquire()
+            if release is not None:
+                return release
+            if time.monotonic() >= deadline:
+                raise PasswordHasherBusy('no free password hashing slot')
+            time.sleep(self.poll_interval)
+
+
+class PasswordHasher:
+    def __init__(self, method, salt_length=16, workers=0, timeout=10, slots=None):
+        # method は werkzeug の形式 (例: scrypt, scrypt:32768:8:1, pbkdf2:sha256:1000000)
+        self.method = method
+        self.salt_length = salt_length
+        self.workers = workers
+        self.timeout = timeout
+        self.slots = slots
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self._current_prefix = None
+
+    def _get_executor(self):
+        # gunicorn がワーカーを fork した後は、そのワーカー用のプールを作り直す
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _run(self, function, *args):
+        release = self.slots.acquire() if self.slots else (lambda: None)
+        if not self.workers:
+            try:
+                return function(*args)
+            finally:
+                release()
+        try:
+            future = self._get_executor().submit(function, *args)
+        except BaseException:
+            release()
+            raise
+        # 待ちきれずに戻ってもプールでの計算は続くので、枠は計算が終わったときに返す
+        future.add_done_callback(lambda _: release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError as exc:
+            future.cancel()
+            raise PasswordHasherBusy('password hashing timed out') from exc
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def current_prefix(self):
+        # 現在の設定で作ったハッシュの先頭 (方式とパラメータ)。method でパラメータを省略すると
+        # werkzeug の既定値が入る (scrypt → scrypt:32768:8:1) ので、実際に 1 回ハッシュを作って調べる
+        if self._current_prefix is None:
+            self._current_prefix = generate_password_hash('', self.method, 1).split('$', 1)[0]
+        return self._current_prefix
+
+    def needs_rehash(self, pwhash):
+        # 保存済みのハッシュが現在の設定と違う方式・パラメータで作られているか
+        return pwhash.split('$', 1)[0] != self.current_prefix()
@@ -0,0 +1,114 @@
+# ログイン・登録の試行回数を制限するトークンバケット。
+# バケットの状態はストアに保存する:
+#   MemoryBucketStore  プロセス内 (開発用。gunicorn のワーカー間では共有されない)
+#   SQLiteBucketStore  同じホストのワーカー間で共有する SQLite ファイル
+# 許可・拒否の件数もストアに記録し、counters() で参照できる
+import os
+import random
+import sqlite3
+import threading
+import time
+
+# この割合の呼び出しごとに、満タンに戻ったバケット (= 記録しておく必要がないもの) を削除する
+PRUNE_PROBABILITY = 0.01
+
+
+def parse_limit(value):
+    # "10/60" → 60 秒あたり 10 回 (容量 10, 毎秒 10/60 トークン補充)
+    count, seconds = value.split('/')
+    return int(count), int(count) / float(seconds)
+
+
+def _refill(tokens, updated_at, capacity, rate, now):
+    return min(capacity, tokens + (now - updated_at) * rate)
+
+
+class MemoryBucketStore:
+    def __init__(self):
+        self._buckets = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, counter):
+        now = time.time()
+        with self._lock:
+            tokens, updated_at, _ = self._buckets.get(key, (capacity, now, now))
+            tokens = _refill(tokens, updated_at, capacity, rate, now)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            name = f"{counter}.{'allowed' if allowed else 'rejected'}"
+            self._counters[name] = self._counters.get(name, 0) + 1
+            if random.random() < PRUNE_PROBABILITY:
+                self._buckets = {k: v for k, v in self._buckets.items() if v[2] > now}
+        return allowed
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+
+class SQLiteBucketStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        # sqlite3 の接続はスレッド・プロセスをまたいで使えないので、それぞれで開き直す
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS buckets ('
+                'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, full_at REAL NOT NULL)'
+            )
+            connection.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def take(self, key, capacity, rate, counter):
+        connection = self._connection()
+        now = time.time()
+        # BEGIN IMMEDIATE で書き込みロックを取り、複数のワーカーが同じトークンを使わないようにする
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT tokens, updated_at FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens = _refill(row[0], row[1], capacity, rate, now) if row else capacity
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            connection.execute(
+                'INSERT INTO buckets (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, '
+                'updated_at = excluded.updated_at, full_at = excluded.full_at',
+                (key, tokens, now, now + (capacity - tokens) / rate)
+            )
+            connection.execute(
+                'INSERT INTO counters (name, value) VALUES (?, 1) '
+                'ON CONFLICT (name) DO UPDATE SET value = value + 1',
+                (f"{counter}.{'allowed' if allowed else 'rejected'}",)
+            )
+            if random.random() < PRUNE_PROBABILITY:
+                connection.execute('DELETE FROM buckets WHERE full_at <= ?', (now,))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return allowed
+
+    def counters(self):
+        return dict(self._connection().execute('SELECT name, value FROM counters').fetchall())
+
+
+class RateLimiter:
+    def __init__(self, store, name, limit):
+        self.store = store
+        self.name = name
+        self.capacity, self.rate = parse_limit(limit)
+
+    def hit(self, key):
+        # トークンを 1 つ使う。残っていなければ False (= この試行は拒否する)
+        return self.store.take(f'{self.name}:{key}', self.capacity, self.rate, self.name)
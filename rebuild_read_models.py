@@ -0,0 +1,15 @@
+# ダッシュボードの読み取りモデル (dashboard_company, calendar_event) と全文検索の索引 (search_document) を
+# 元のデータから作り直す。
+#   python rebuild_read_models.py              全ユーザー
+#   python rebuild_read_models.py USERNAME...  指定したユーザーだけ
+import sys
+
+from app import app, db, rebuild_read_models, rebuild_search_documents, User
+
+with app.app_context():
+    user_ids = None
+    if len(sys.argv) > 1:
+        user_ids = db.session.execute(db.select(User.id).where(User.username.in_(sys.argv[1:]))).scalars().all()
+    count = rebuild_read_models(db.engine, user_ids)
+    rebuild_search_documents(db.engine, user_ids)
+    print(f"{count} 人分の読み取りモデルと検索の索引を作り直しました。")
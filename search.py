@@ -0,0 +1,75 @@
+# 全文検索用のトークン分割。
+# 日本語は空白で単語が区切られないため、文字の連なりを 2 文字ずつずらした bigram に分割して索引にする
+# (例: "面接対策" -> "面接" "接対" "対策" "策")。連なりの最後の 1 文字も入れておくと、
+# 1 文字の検索語は「その文字で始まるトークン」の前方一致ですべての出現位置に当たる。
+# 索引と検索語で同じ正規化 (NFKC + 小文字) をするので、全角・半角や大文字・小文字の違いは無視される。
+import re
+import unicodedata
+
+# 文字・数字の連なり (アンダースコアや記号・空白で区切る)
+_RUN = re.compile(r'[^\W_]+')
+# 検索語から作るトークンの上限 (長い文章を貼り付けられても検索が重くならないように)
+MAX_QUERY_TOKENS = 32
+# 半角カナの濁点・半濁点 (NFKC では前の文字と合わせて 1 文字になる)
+_HALFWIDTH_SOUND_MARKS = '\uff9e\uff9f'
+
+
+def normalize(text):
+    return unicodedata.normalize('NFKC', text or '').lower()
+
+
+def _runs(text):
+    return _RUN.findall(normalize(text))
+
+
+def index_tokens(text):
+    # 索引に入れるトークン (出現回数もランキングに使うので重複は残す)
+    tokens = []
+    for run in _runs(text):
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        tokens.append(run[-1])
+    return tokens
+
+
+def query_tokens(text):
+    # 検索語のトークン: [(トークン, 前方一致か), ...]。すべてを含む文書が当たる
+    tokens = []
+    for run in _runs(text):
+        if len(run) == 1:
+            tokens.append((run, True))
+        else:
+            tokens.extend((run[i:i + 2], False) for i in range(len(run) - 1))
+    return list(dict.fromkeys(tokens))[:MAX_QUERY_TOKENS]
+
+
+def _clusters(text):
+    # 結合文字 (濁点など) を直前の文字とまとめた単位。NFKC で 1 文字にまとまるものを分けないため
+    cluster = ''
+    for char in text:
+        if cluster and (unicodedata.combining(char) or char in _HALFWIDTH_SOUND_MARKS):
+            cluster += char
+            continue
+        if cluster:
+            yield cluster
+        cluster = char
+    if cluster:
+        yield cluster
+
+
+def snippet(text, query, width=80):
+    # 検索語が最初に現れるあたりの抜粋。位置は正規化した本文で探し、表示には元の本文 (空白だけ詰める) を切り出す
+    text = ' '.join((text or '').split())
+    normalized = []
+    offsets = []
+    position = 0
+    for cluster in _clusters(text):
+        folded = normalize(cluster)
+        normalized.append(folded)
+        offsets.extend([position] * len(folded))
+        position += len(cluster)
+    normalized = ''.join(normalized)
+    found = min((normalized.find(run) for run in _runs(query) if run in normalized), default=None)
+    position = offsets[found] if found is not None else 0
+    start = max(0, position - width // 4)
+    excerpt = text[start:start + width]
+    return ('…' if start else '') + excerpt + ('…' if start + width < len(text) else '')
@@ -0,0 +1,38 @@
+import os
+import sys
+
+# app.py は import 時に環境変数から設定を読むので、先に設定しておく
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['RATELIMIT_STORAGE'] = 'memory'
+os.environ['RATELIMIT_LOGIN_IP'] = os.environ['RATELIMIT_LOGIN_USER'] = os.environ['RATELIMIT_REGISTER_IP'] = '10000/60'
+os.environ['PASSWORD_HASH_WORKERS'] = '0'
+os.environ['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+os.environ['CACHE_URL'] = 'memory://'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from app import app as flask_app, db, fragment_cache, user_cache
+
+
+@pytest.fixture
+def app():
+    flask_app.config['TESTING'] = True
+    with flask_app.app_context():
+        db.create_all()
+    yield flask_app
+    with flask_app.app_context():
+        db.session.remove()
+        db.drop_all()
+    fragment_cache.clear()
+    user_cache.clear()
+
+
+@pytest.fixture
+def client(app):
+    # 登録・ログイン済みのクライアント
+    client = app.test_client()
+    client.post('/register', data={'username': 'user', 'password': 'password', 'confirm_password': 'password'})
+    response = client.post('/login', data={'username': 'user', 'password': 'password'})
+    assert response.status_code == 302
+    return client
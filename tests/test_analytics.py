@@ -0,0 +1,20 @@
+# 選考の分析ページの集計結果のキャッシュ
+import app as app_module
+from app import fragment_cache
+
+
+def test_summary_cached_by_other_code_is_not_reused(client, monkeypatch):
+    client.post('/dashboard', data={'name': 'A社'})
+    monkeypatch.setattr(app_module, 'SOURCE_VERSION', 'previous-deploy')
+    keys = []
+    set_ = fragment_cache.set
+    monkeypatch.setattr(fragment_cache, 'set', lambda key, value, *args: keys.append(key) or set_(key, value, *args))
+    assert client.get('/analytics').status_code == 200
+    # 前のデプロイのコードがキャッシュした、durations のない集計結果
+    (key,) = keys
+    summary = fragment_cache.get(key)
+    del summary['durations']
+    set_(key, summary)
+
+    monkeypatch.setattr(app_module, 'SOURCE_VERSION', 'next-deploy')
+    assert client.get('/analytics').status_code == 200
@@ -0,0 +1,43 @@
+# 企業詳細ページの描画済み HTML のキャッシュが、削除された企業の id を再利用した別のユーザーの企業に出ないこと
+import pytest
+
+from app import Company, company_section_keys, db, fragment_cache
+
+
+def login(app, username):
+    client = app.test_client()
+    client.post('/register', data={'username': username, 'password': 'password', 'confirm_password': 'password'})
+    assert client.post('/login', data={'username': username, 'password': 'password'}).status_code == 302
+    return client
+
+
+def company_keys(app, company_id):
+    with app.app_context():
+        return company_section_keys(db.session.get(Company, company_id))
+
+
+@pytest.mark.parametrize('keep_stale_entries', [False, True])
+def test_reused_company_id_does_not_show_previous_fragments(app, keep_stale_entries):
+    alice = login(app, 'alice')
+    alice.post('/dashboard', data={'name': 'A社'})
+    alice.post('/company/1/memo/add', data={'title': 'メモ', 'content': 'ALICE-SECRET'})
+    assert 'ALICE-SECRET' in alice.get('/company/1').get_data(as_text=True)
+    cached = {key: fragment_cache.get(key) for key in company_keys(app, 1).values()}
+    alice.post('/company/1/delete')
+    # 削除したときにキャッシュも消える
+    assert all(fragment_cache.get(key) is None for key in cached)
+    if keep_stale_entries:
+        # 別のワーカーのキャッシュや、DB を作り直した後の永続的なキャッシュに残っている場合
+        for key, value in cached.items():
+            fragment_cache.set(key, value)
+
+    bob = login(app, 'bob')
+    bob.post('/dashboard', data={'name': 'B社'})
+    with app.app_context():
+        company = db.session.get(Company, 1)
+        assert company.name == 'B社'
+    bob.post('/company/1/memo/add', data={'title': 'メモ', 'content': 'BOB-MEMO'})
+    assert set(company_keys(app, 1).values()).isdisjoint(cached)
+    html = bob.get('/company/1').get_data(as_text=True)
+    assert 'BOB-MEMO' in html
+    assert 'ALICE-SECRET' not in html
@@ -0,0 +1,34 @@
+# ETag の salt と描画済み HTML のキャッシュキーは、ワーカー (プロセス) ごとに変わってはいけない
+import os
+import subprocess
+import sys
+
+import app as app_module
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def salt_in_new_process():
+    env = {k: v for k, v in os.environ.items() if k not in ('ETAG_SALT', 'RENDER_GIT_COMMIT')}
+    return subprocess.run(
+        [sys.executable, '-c', "import app; print(app.app.config['ETAG_SALT'], app.SOURCE_VERSION)"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout.split()
+
+
+def test_default_salt_is_the_same_in_every_process():
+    first = salt_in_new_process()
+    assert first == salt_in_new_process()
+    assert first[0] == first[1] == app_module.SOURCE_VERSION
+
+
+def test_fragment_cache_survives_a_different_etag_salt(app, client, monkeypatch):
+    client.post('/dashboard', data={'name': '企業'})
+    assert client.get('/company/1').status_code == 200
+    monkeypatch.setitem(app.config, 'ETAG_SALT', 'another-deploy')
+
+    def reload_sections(*args, **kwargs):
+        raise AssertionError('sections were rendered again')
+
+    monkeypatch.setattr(app_module, 'load_company_sections', reload_sections)
+    assert client.get('/company/1').status_code == 200
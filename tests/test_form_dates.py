@@ -0,0 +1,54 @@
+# 日付・日時の欄に解釈できない値が入力されたときは、保存せずにエラーを表示する
+import pytest
+
+from app import Document, Interview, Task, db
+
+
+@pytest.fixture
+def company(client):
+    client.post('/dashboard', data={'name': '企業'})
+    return 1
+
+
+def count(app, model):
+    with app.app_context():
+        return db.session.execute(db.select(db.func.count()).select_from(model)).scalar()
+
+
+@pytest.mark.parametrize('url, data, model', [
+    ('/tasks', {'content': 'ES を書く', 'deadline': '6/20'}, Task),
+    ('/documents', {'document_name': '履歴書', 'submission_date': '来週'}, Document),
+    ('/interviews', {'company_id': '1', 'date_time': '6/20 14時'}, Interview),
+    ('/company/1/task/add', {'content': 'ES を書く', 'deadline': '6/20'}, Task),
+    ('/company/1/document/add', {'document_name': '履歴書', 'submission_date': '来週'}, Document),
+    ('/company/1/interview/add', {'date_time': '6/20 14時'}, Interview),
+])
+def test_unparseable_date_is_rejected(app, client, company, url, data, model):
+    response = client.post(url, data=data)
+    assert response.status_code == 200
+    html = response.get_data(as_text=True)
+    assert 'flash danger' in html and '読み取れませんでした' in html
+    assert count(app, model) == 0
+
+
+def test_list_form_keeps_input(client, company):
+    html = client.post('/tasks', data={'content': 'ES を書く', 'deadline': '6/20', 'company_id': '1'}).get_data(as_text=True)
+    assert 'value="ES を書く"' in html
+    assert '<option value="1" selected>' in html
+
+
+def test_edit_keeps_stored_date(app, client, company):
+    client.post('/tasks', data={'content': 'ES を書く', 'deadline': '2025-06-20'})
+    response = client.post('/task/1/edit', data={'content': '変更', 'deadline': '6/20', 'status': '未完了'})
+    assert '読み取れませんでした' in response.get_data(as_text=True)
+    with app.app_context():
+        task = db.session.get(Task, 1)
+        assert (task.content, task.deadline.isoformat()) == ('ES を書く', '2025-06-20')
+
+
+def test_empty_and_valid_dates_are_saved(app, client, company):
+    client.post('/tasks', data={'content': '期限なし', 'deadline': ''})
+    client.post('/tasks', data={'content': '期限あり', 'deadline': '2025/06/20'})
+    with app.app_context():
+        deadlines = db.session.execute(db.select(Task.content, Task.deadline).order_by(Task.id)).all()
+    assert [(content, str(deadline)) for content, deadline in deadlines] == [('期限なし', 'None'), ('期限あり', '2025-06-20')]
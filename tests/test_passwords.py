@@ -0,0 +1,61 @@
+# パスワードのハッシュ計算の同時実行数の上限と、混み合っているときの応答
+import time
+
+import pytest
+
+from app import password_hasher
+from passwords import HashSlots, PasswordHasher, PasswordHasherBusy
+
+
+def test_slots_are_shared_between_acquirers(tmp_path):
+    slots = HashSlots(str(tmp_path), 2, wait=0.1)
+    first, second = slots.acquire(), slots.acquire()
+    started = time.monotonic()
+    with pytest.raises(PasswordHasherBusy):
+        slots.acquire()
+    assert time.monotonic() - started < 1
+    first()
+    slots.acquire()()
+    second()
+
+
+def test_hasher_releases_slot_after_hashing(tmp_path):
+    hasher = PasswordHasher('pbkdf2:sha256:1000', slots=HashSlots(str(tmp_path), 1, wait=0))
+    pwhash = hasher.hash('password')
+    assert hasher.verify(pwhash, 'password')
+    assert not hasher.verify(pwhash, 'wrong')
+
+
+def test_pool_timeout_raises_busy():
+    hasher = PasswordHasher('pbkdf2:sha256:5000000', workers=1, timeout=0.01)
+    with pytest.raises(PasswordHasherBusy):
+        hasher.hash('password')
+
+
+def test_login_returns_503_when_saturated(app, tmp_path, monkeypatch):
+    client = app.test_client()
+    client.post('/register', data={'username': 'user', 'password': 'password', 'confirm_password': 'password'})
+    slots = HashSlots(str(tmp_path), 1, wait=0)
+    monkeypatch.setattr(password_hasher, 'slots', slots)
+    release = slots.acquire()
+    try:
+        response = client.post('/login', data={'username': 'user', 'password': 'password'})
+    finally:
+        release()
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '5'
+    assert '混み合っています' in response.get_data(as_text=True)
+    assert client.post('/login', data={'username': 'user', 'password': 'password'}).status_code == 302
+
+
+@pytest.mark.parametrize('method', ['pbkdf2:sha256', 'pbkdf2:sha256:1000', 'scrypt'])
+def test_hash_made_with_current_settings_needs_no_rehash(method):
+    # パラメータを省略した方式でも、保存済みのハッシュ (パラメータ付き) と比べて毎回作り直さない
+    hasher = PasswordHasher(method)
+    assert not hasher.needs_rehash(hasher.hash('password'))
+
+
+def test_hash_made_with_other_settings_needs_rehash():
+    old = PasswordHasher('pbkdf2:sha256:1000').hash('password')
+    assert PasswordHasher('pbkdf2:sha256:2000').needs_rehash(old)
+    assert PasswordHasher('scrypt').needs_rehash(old)
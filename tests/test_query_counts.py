@@ -0,0 +1,81 @@
+# 一覧・詳細ページが発行するクエリ数。N+1 が再発すると企業や面接の件数に比例して増えるので、
+# 複数の企業・面接を登録した状態で件数がちょうどこの値になることを確認する
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app import APP_TZ, db
+
+COMPANIES = 5
+INTERVIEWS_PER_COMPANY = 3
+
+
+@pytest.fixture
+def seeded(client):
+    tomorrow = datetime.now(APP_TZ) + timedelta(days=1)
+    for i in range(COMPANIES):
+        client.post('/dashboard', data={'name': f'企業{i}', 'industry': 'IT'})
+        company_id = i + 1
+        for j in range(INTERVIEWS_PER_COMPANY):
+            at = tomorrow + timedelta(days=j)
+            client.post(f'/company/{company_id}/interview/add', data={
+                'date_time': at.strftime('%Y-%m-%dT%H:%M'), 'person': f'面接官{j}', 'notes': 'メモ',
+            })
+        client.post(f'/company/{company_id}/task/add', data={'content': 'ES を書く', 'deadline': (date.today() + timedelta(days=3)).isoformat()})
+        client.post(f'/company/{company_id}/memo/add', data={'title': '逆質問', 'content': '<p>準備する</p>'})
+    # ログインユーザーのキャッシュなど、初回だけ読むものを読ませておく
+    assert client.get('/dashboard').status_code == 200
+    return client
+
+
+@pytest.fixture
+def count_queries(app):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    yield statements
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+def get(client, statements, url):
+    statements.clear()
+    response = client.get(url)
+    assert response.status_code == 200
+    return len(statements)
+
+
+def test_dashboard(seeded, count_queries):
+    # データバージョン (ETag) + 企業一覧 + 絞り込みの件数
+    assert get(seeded, count_queries, '/dashboard') == 3
+    assert get(seeded, count_queries, '/dashboard?sort=application_date&order=desc&industry=IT') == 3
+
+
+def test_calendar_events(seeded, count_queries):
+    # データバージョン (ETag) + 予定
+    start = date.today()
+    end = start + timedelta(days=31)
+    assert get(seeded, count_queries, f'/calendar/events?start={start}&end={end}') == 2
+
+
+def test_company_detail(seeded, count_queries):
+    # 初回: データバージョン (ETag) + 企業 + キャッシュにない各一覧をまとめて 1 クエリ
+    assert get(seeded, count_queries, '/company/1') == 3
+    # 2 回目は一覧を描画済みの HTML から出す
+    assert get(seeded, count_queries, '/company/1') == 2
+    # メモだけ変えると、メモの一覧だけを読み直す
+    seeded.post('/memo/1/edit', data={'title': '逆質問', 'content': '<p>変更</p>'})
+    assert get(seeded, count_queries, '/company/1') == 3
+
+
+def test_not_modified_runs_only_the_version_query(seeded, count_queries):
+    etag = seeded.get('/dashboard').headers['ETag']
+    count_queries.clear()
+    response = seeded.get('/dashboard', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert len(count_queries) == 1
@@ -0,0 +1,25 @@
+# 検索結果の抜粋は、正規化した本文で位置を探し、元の本文 (大文字・全角のまま) を表示する
+from search import snippet
+
+
+def test_snippet_keeps_original_case_and_width():
+    assert snippet('Google の ＥＳ 締切', 'es') == 'Google の ＥＳ 締切'
+
+
+def test_snippet_starts_near_the_match():
+    text = 'あ' * 100 + 'Google本社で面接' + 'い' * 100
+    excerpt = snippet(text, 'google', width=40)
+    assert excerpt.startswith('…') and excerpt.endswith('…')
+    assert 'Google本社' in excerpt
+    assert len(excerpt) == 42
+
+
+def test_snippet_position_survives_length_changing_normalization():
+    # ㈱ は NFKC で (株) の 3 文字、ｶﾞ は ガ の 1 文字になる
+    text = '㈱' * 30 + 'ｶﾞｲｼ' * 10 + 'Target'
+    excerpt = snippet(text, 'target', width=20)
+    assert 'Target' in excerpt
+
+
+def test_snippet_without_match_starts_at_the_beginning():
+    assert snippet('Hello  World', '存在しない') == 'Hello World'
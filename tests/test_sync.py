@@ -0,0 +1,18 @@
+# 差分同期 (/sync) の cursor
+import pytest
+
+
+def test_sync_returns_changes_since_cursor(client):
+    client.post('/dashboard', data={'name': '企業'})
+    full = client.get('/sync').get_json()
+    assert [company['name'] for company in full['changes']['company']] == ['企業']
+    client.post('/company/1/delete')
+    delta = client.get('/sync', query_string={'cursor': full['cursor']}).get_json()
+    assert delta['changes']['company'] == []
+    assert delta['deleted']['company'] == [1]
+
+
+@pytest.mark.parametrize('cursor', ['W251bGxd', 'WzFd', 'WyJ4Il0', 'not-a-cursor', 'W10'])
+def test_malformed_cursor_is_rejected(client, cursor):
+    # [null] / [1] / ["x"] / 壊れた base64 / []
+    assert client.get('/sync', query_string={'cursor': cursor}).status_code == 400